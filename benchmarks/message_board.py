@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""Compare mp_message_board backends: Manager dict (plain and cached()) vs. memory-mapped file.
+
+Each backend is exercised by a number of concurrent worker processes doing the
+operations fixtures typically perform (``in`` checks, reads, and writes) and the
+per-operation latency and throughput are reported as JSON:
+
+    python benchmarks/message_board.py --workers 1,8,32 --operations 2000
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+
+from pytest_mp.board import ManagerMessageBoard, MMapMessageBoard
+
+
+def csv_list(value):
+    return [int(x) for x in value.split(',') if x]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=csv_list, default=[1, 4, 16])
+    parser.add_argument('--operations', type=int, default=2000, help='Operations of each kind per worker.')
+    parser.add_argument('--keys', type=int, default=100)
+    parser.add_argument('--value-size', type=int, default=100)
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout.')
+    return parser.parse_args(argv)
+
+
+def exercise(board, worker, options, start, results):
+    keys = ['key{}'.format(i) for i in range(options.keys)]
+    value = 'x' * options.value_size
+    start.wait()
+
+    timings = dict()
+    began = time.time()
+    for i in range(options.operations):
+        keys[i % options.keys] in board
+    timings['contains'] = time.time() - began
+
+    began = time.time()
+    for i in range(options.operations):
+        board.get(keys[i % options.keys])
+    timings['get'] = time.time() - began
+
+    began = time.time()
+    for i in range(options.operations):
+        board['{}-{}'.format(worker, i % options.keys)] = value
+    timings['set'] = time.time() - began
+
+    results.put(timings)
+
+
+def run(backend, board, workers, options):
+    for i in range(options.keys):
+        board['key{}'.format(i)] = 'x' * options.value_size
+
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=exercise, args=(board, i, options, start, results)) for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    began = time.time()
+    start.set()
+    timings = [results.get() for _ in procs]
+    wall = time.time() - began
+    for proc in procs:
+        proc.join()
+
+    result = dict(backend=backend, workers=workers, wall=wall,
+                  throughput=3 * options.operations * workers / wall)
+    for operation in ('contains', 'get', 'set'):
+        result['{}_latency'.format(operation)] = sum(x[operation] for x in timings) / (options.operations * workers)
+    sys.stderr.write('{backend:>8} workers={workers:<3} {throughput:10.0f} ops/s  contains {contains_latency:.6f}s  '
+                     'get {get_latency:.6f}s  set {set_latency:.6f}s\n'.format(**result))
+    return result
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    manager = multiprocessing.Manager()
+    results = []
+    for workers in options.workers:
+        results.append(run('manager', ManagerMessageBoard(manager.dict()), workers, options))
+        results.append(run('cached', ManagerMessageBoard(manager.dict()).cached(), workers, options))
+        board = MMapMessageBoard.create()
+        try:
+            results.append(run('mmap', board, workers, options))
+        finally:
+            board.unlink()
+
+    output = dict(meta=dict(python=platform.python_version(), platform=platform.platform(),
+                            cpu_count=multiprocessing.cpu_count()),
+                  results=results)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    else:
+        sys.stdout.write(json.dumps(output, indent=2, sort_keys=True) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
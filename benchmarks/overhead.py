@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""Measure pytest-mp's own overhead on generated synthetic test projects.
+
+Every scenario (number of tests x strategy x group size x test duration) is run
+under plain pytest, pytest with pytest-mp loaded but disabled, ``--mp`` with
+each requested ``--np``, and pytest-xdist as a reference parallel runner when it
+is installed.  Results are written as JSON and can be compared against a
+previous run to catch regressions before release.  The time it takes to import
+the plugin, the per-session cost of having it installed without ``--mp`` (on a
+project of a single no-op test) and its per-report cost are recorded as well:
+
+    python benchmarks/overhead.py --output results.json
+    python benchmarks/overhead.py --baseline results.json --threshold 0.25
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+
+test_template = """
+import time
+
+import pytest
+
+DURATION = {duration!r}
+
+
+@pytest.mark.mp_group('{group}', '{strategy}')
+@pytest.mark.parametrize('val', range({group_size}))
+def test_{index}(val):
+    if DURATION:
+        time.sleep(DURATION)
+"""
+
+
+def csv_list(cast):
+    def parse(value):
+        return [cast(x) for x in value.split(',') if x]
+    return parse
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tests', type=int, default=50, help='Number of tests per scenario.')
+    parser.add_argument('--strategies', type=csv_list(str), default=['free', 'serial', 'isolated_free', 'isolated_serial'])
+    parser.add_argument('--group-sizes', type=csv_list(int), default=[1, 10])
+    parser.add_argument('--durations', type=csv_list(float), default=[0.0, 0.1],
+                        help='Per test durations in seconds: 0 is a no-op, anything else sleeps (I/O-bound).')
+    parser.add_argument('--np', dest='num_processes', type=csv_list(int), default=[2, 4])
+    parser.add_argument('--no-reference', dest='reference', action='store_false',
+                        help='Skip the pytest-xdist reference runs.')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout.')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Relative wall time increase over the baseline considered a regression.')
+    return parser.parse_args(argv)
+
+
+def generate_project(directory, tests, strategy, group_size, duration):
+    os.makedirs(directory)
+    with open(os.path.join(directory, 'test_synthetic.py'), 'w') as f:
+        for index in range(0, tests, group_size):
+            f.write(test_template.format(duration=duration, group='Group{}'.format(index), strategy=strategy,
+                                         group_size=min(group_size, tests - index), index=index))
+
+
+def runners(num_processes, reference):
+    yield 'pytest', ['-p', 'no:pytest-mp']
+    yield 'pytest+plugin', []
+    for np in num_processes:
+        yield 'mp-np{}'.format(np), ['--mp', '--np={}'.format(np)]
+    if reference:
+        try:
+            import xdist  # noqa F401
+        except ImportError:
+            return
+        for np in num_processes:
+            yield 'xdist-n{}'.format(np), ['-p', 'no:pytest-mp', '-n', str(np)]
+
+
+class TreeMonitor(threading.Thread):
+    """Sample CPU time and RSS of a pytest process and its descendants."""
+
+    interval = .02
+
+    def __init__(self, pid):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.process = psutil.Process(pid)
+        self.finished = threading.Event()
+        self.children = dict()
+        self.parent_cpu = 0.0
+        self.peak_parent_rss = 0
+        self.peak_tree_rss = 0
+
+    def run(self):
+        while not self.finished.is_set():
+            try:
+                cpu = self.process.cpu_times()
+                rss = self.process.memory_info().rss
+                children = self.process.children(recursive=True)
+            except psutil.Error:
+                return
+            self.parent_cpu = cpu.user + cpu.system
+            self.peak_parent_rss = max(self.peak_parent_rss, rss)
+            for child in children:
+                try:
+                    child_cpu = child.cpu_times()
+                    rss += child.memory_info().rss
+                    self.children[child.pid] = (child.create_time(), child_cpu.user + child_cpu.system)
+                except psutil.Error:
+                    continue
+            self.peak_tree_rss = max(self.peak_tree_rss, rss)
+            self.finished.wait(self.interval)
+
+    def manager_cpu(self):
+        # The multiprocessing Manager server is the first child pytest-mp starts.
+        if not self.children:
+            return None
+        return min(self.children.values())[1]
+
+
+def run_scenario(directory, args):
+    cmd = [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider', 'test_synthetic.py'] + args
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        proc = subprocess.Popen(cmd, cwd=directory, stdout=devnull, stderr=subprocess.STDOUT)
+        monitor = TreeMonitor(proc.pid)
+        monitor.start()
+        returncode = proc.wait()
+        wall = time.time() - start
+    monitor.finished.set()
+    monitor.join()
+    return dict(wall=wall, returncode=returncode, parent_cpu=monitor.parent_cpu, manager_cpu=monitor.manager_cpu(),
+                peak_parent_rss=monitor.peak_parent_rss, peak_tree_rss=monitor.peak_tree_rss)
+
+
+def parallelism(runner, scenario):
+    """Best possible concurrency for a scenario under a runner"""
+    if runner.startswith('pytest'):
+        return 1
+    workers = int(runner.split('-')[1].lstrip('np'))
+    if runner.startswith('xdist'):
+        return workers
+    num_groups = -(-scenario['tests'] // scenario['group_size'])
+    return dict(free=workers,
+                serial=min(workers, num_groups),
+                isolated_free=min(workers, scenario['group_size']),
+                isolated_serial=1)[scenario['strategy']]
+
+
+import_script = """
+import time
+import pytest
+start = time.time()
+import pytest_mp.plugin
+print(time.time() - start)
+"""
+
+
+def measure_import_time(repeat=5):
+    """Best time to import pytest_mp.plugin on top of pytest, in a fresh interpreter"""
+    return min(float(subprocess.check_output([sys.executable, '-c', import_script])) for _ in range(repeat))
+
+
+def measure_session_overhead(repeat=5):
+    """Best wall time a session without --mp takes with the plugin loaded over one without it"""
+    root = tempfile.mkdtemp(prefix='pytest-mp-bench-')
+    try:
+        directory = os.path.join(root, 'session')
+        generate_project(directory, 1, 'free', 1, 0.0)
+        walls = dict()
+        for runner, args in (('pytest', ['-p', 'no:pytest-mp']), ('pytest+plugin', [])):
+            walls[runner] = min(run_scenario(directory, args)['wall'] for _ in range(repeat))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return walls['pytest+plugin'] - walls['pytest']
+
+
+def run_benchmarks(options):
+    results = []
+    scenarios = itertools.product(options.strategies, options.group_sizes, options.durations)
+    root = tempfile.mkdtemp(prefix='pytest-mp-bench-')
+    try:
+        for index, (strategy, group_size, duration) in enumerate(scenarios):
+            directory = os.path.join(root, 'scenario{}'.format(index))
+            generate_project(directory, options.tests, strategy, group_size, duration)
+            scenario = dict(tests=options.tests, strategy=strategy, group_size=group_size, duration=duration)
+            walls = dict()
+            for runner, args in runners(options.num_processes, options.reference):
+                measured = run_scenario(directory, args)
+                walls[runner] = measured['wall']
+                if runner == 'pytest+plugin':
+                    # What having the plugin installed costs every test report without --mp.
+                    measured['per_report_overhead'] = (measured['wall'] - walls['pytest']) / options.tests
+                work = options.tests * duration
+                measured.update(scenario=scenario, runner=runner,
+                                throughput=options.tests / measured['wall'],
+                                overhead_per_test=(measured['wall'] - work / parallelism(runner, scenario))
+                                / options.tests)
+                results.append(measured)
+                sys.stderr.write('{strategy:>15} size={group_size:<3} duration={duration:<5} {runner:<14} '
+                                 '{wall:7.2f}s {overhead:8.4f}s/test\n'
+                                 .format(runner=runner, wall=measured['wall'], overhead=measured['overhead_per_test'],
+                                         **scenario))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def result_key(result):
+    scenario = result['scenario']
+    return (scenario['tests'], scenario['strategy'], scenario['group_size'], scenario['duration'], result['runner'])
+
+
+def find_regressions(results, baseline, threshold):
+    previous = dict((result_key(x), x) for x in baseline['results'])
+    regressions = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None or result['runner'].startswith('xdist'):
+            continue
+        # Ignore tiny absolute differences that are dominated by noise.
+        if result['wall'] > before['wall'] * (1 + threshold) and result['wall'] - before['wall'] > .05:
+            regressions.append((result, before))
+    return regressions
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    import_time = measure_import_time()
+    sys.stderr.write('pytest_mp.plugin import time {:.4f}s\n'.format(import_time))
+    session_overhead = measure_session_overhead()
+    sys.stderr.write('pytest_mp session overhead without --mp {:.4f}s\n'.format(session_overhead))
+    results = run_benchmarks(options)
+    output = dict(meta=dict(python=platform.python_version(), platform=platform.platform(),
+                            cpu_count=psutil.cpu_count(), pytest=pytest_version(), import_time=import_time,
+                            session_overhead=session_overhead),
+                  results=results)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    else:
+        sys.stdout.write(json.dumps(output, indent=2, sort_keys=True) + '\n')
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, options.threshold)
+        for result, before in regressions:
+            sys.stderr.write('REGRESSION {}: {:.2f}s -> {:.2f}s\n'.format(result_key(result), before['wall'],
+                                                                          result['wall']))
+        before = baseline['meta'].get('import_time')
+        slower_import = before is not None and import_time > before * (1 + options.threshold) \
+            and import_time - before > .005
+        if slower_import:
+            sys.stderr.write('REGRESSION import time: {:.4f}s -> {:.4f}s\n'.format(before, import_time))
+        before = baseline['meta'].get('session_overhead')
+        # The overhead is a difference of two wall times, so only an absolute increase is meaningful.
+        slower_session = before is not None and session_overhead - before > .05
+        if slower_session:
+            sys.stderr.write('REGRESSION session overhead without --mp: {:.4f}s -> {:.4f}s\n'
+                             .format(before, session_overhead))
+        if regressions or slower_import or slower_session:
+            return 1
+    return 0
+
+
+def pytest_version():
+    import pytest
+    return pytest.__version__
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1 @@
+from pytest_mp.shared import mp_shared_fixture  # noqa F401
@@ -0,0 +1,632 @@
+import multiprocessing
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import fcntl
+
+
+# A message board backed by a memory-mapped file instead of a Manager server.
+#
+# The file is an append-only log of versioned records after a fixed header:
+#
+#     header: magic, layout, epoch, end offset, generation, capacity
+#     record: key length, value length, version, flags, pickled key, pickled value
+#
+# Every process keeps its own index of key -> record and only scans records
+# appended since its last look, so reads never leave the process beyond an
+# flock() call.  Writers append under an exclusive lock; when the file is full
+# live records are compacted in place (bumping the epoch so readers rebuild
+# their index) or the file is grown.
+
+_header = struct.Struct('<4sIQQQQ')
+_record = struct.Struct('<IIQB')
+_magic = b'MPMB'
+_layout = 1
+_deleted = 1
+
+
+class Subscription(object):
+    """Changes to a set of board keys made after subscribing, see MessageBoardNotifications.subscribe()"""
+
+    def __init__(self, board, keys):
+        self.board = board
+        self.versions = dict((key, board.version(key)) for key in keys)
+
+    def _changed(self):
+        for key, seen in self.versions.items():
+            version = self.board.version(key)
+            if version != seen:
+                self.versions[key] = version
+                return key, self.board.get(key)
+        return None
+
+    def get(self, timeout=None):
+        """Block until one of the keys changes and return (key, value); value is None if it was deleted"""
+        change = self.board._wait(self._changed, timeout)
+        if change is None:
+            raise KeyError('No change to {} within {}s'.format(', '.join(map(str, self.versions)), timeout))
+        return change
+
+    def __iter__(self):
+        while True:
+            yield self.get()
+
+
+class MessageBoardNotifications(object):
+    """Blocking reads for boards that notify their `_changed` condition on every write"""
+
+    poll_interval = .05
+
+    def _change_token(self):
+        """A value that changes with every write, readable without a round-trip, or None if there isn't one"""
+        return None
+
+    def _notify(self):
+        if self._changed is not None:
+            with self._changed:
+                self._changed.notify_all()
+
+    def _wait(self, predicate, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        if self._changed is None:  # Unpickled outside of a forked worker, so there's nobody to notify us.
+            while True:
+                result = predicate()
+                if result is not None or (deadline is not None and time.time() >= deadline):
+                    return result
+                time.sleep(self.poll_interval)
+
+        # The predicate runs without the lock, so writers aren't held up by its reads.  A write
+        # between the predicate and the wait is caught by the change token, or failing that by
+        # waking up every poll_interval.
+        while True:
+            token = self._change_token()
+            result = predicate()
+            if result is not None:
+                return result
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            if token is None:
+                remaining = self.poll_interval if remaining is None else min(remaining, self.poll_interval)
+            with self._changed:
+                if token is None or token == self._change_token():
+                    self._changed.wait(remaining)
+
+    def wait_for(self, key, timeout=None):
+        """Return the value of key as soon as it is set, or raise KeyError after timeout seconds"""
+        def published():
+            return (self[key],) if key in self else None
+
+        value = self._wait(published, timeout)
+        if value is None:
+            raise KeyError(key)
+        return value[0]
+
+    def subscribe(self, *keys):
+        return Subscription(self, keys)
+
+
+class ManagerMessageBoard(MutableMapping, MessageBoardNotifications):
+    """The default board: a Manager dict of key -> (version, value)
+
+    Versions come from a counter in shared memory, so every operation is still a
+    single round-trip to the Manager server.  Writes also bump one of a fixed
+    number of per-key (hashed) change counters, which lets cached() views
+    revalidate values without any round-trip at all.
+    """
+
+    num_change_counters = 4096
+
+    def __init__(self, data, changed=None, generation=None, change_counters=None):
+        self._data = data
+        self._changed = changed if changed is not None else multiprocessing.Condition()
+        self._generation = generation if generation is not None else multiprocessing.Value('Q', 0, lock=False)
+        if change_counters is None:
+            change_counters = multiprocessing.Array('Q', self.num_change_counters, lock=False)
+        self._change_counters = change_counters
+
+    def _counter(self, key):
+        return zlib.crc32(pickle.dumps(key, 2)) % len(self._change_counters)
+
+    def _bump(self):
+        """Return the next version.  Requires the _changed lock."""
+        self._generation.value += 1
+        return self._generation.value
+
+    def _invalidate(self, key):
+        """Bump key's change counter once its new value is in place.  Requires the _changed lock.
+
+        A cached() view reads the counter before the value, so bumping it only
+        after the write means it can never cache the new counter with the old value.
+        """
+        self._change_counters[self._counter(key)] += 1
+
+    def change_counter(self, key):
+        return self._change_counters[self._counter(key)]
+
+    def _change_token(self):
+        return self._generation.value
+
+    def __getitem__(self, key):
+        return self._data[key][1]
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        return default if item is None else item[1]
+
+    def __setitem__(self, key, value):
+        with self._changed:
+            self._data[key] = (self._bump(), value)
+            self._invalidate(key)
+            self._changed.notify_all()
+
+    def __delitem__(self, key):
+        with self._changed:
+            del self._data[key]
+            self._bump()
+            self._invalidate(key)
+            self._changed.notify_all()
+
+    # setdefault(), update() and popitem() are atomic with respect to other writers, as they
+    # were when the board was a plain Manager dict, rather than the MutableMapping mixins.
+
+    def setdefault(self, key, default=None):
+        with self._changed:
+            item = self._data.get(key)
+            if item is not None:
+                return item[1]
+            self._data[key] = (self._bump(), default)
+            self._invalidate(key)
+            self._changed.notify_all()
+        return default
+
+    def update(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+        with self._changed:
+            self._data.update(dict((key, (self._bump(), value)) for key, value in values.items()))
+            for key in values:
+                self._invalidate(key)
+            self._changed.notify_all()
+
+    def popitem(self):
+        with self._changed:
+            key, item = self._data.popitem()
+            self._bump()
+            self._invalidate(key)
+            self._changed.notify_all()
+        return key, item[1]
+
+    def pop(self, key, *default):
+        with self._changed:
+            item = self._data.pop(key, None)
+            self._bump()
+            self._invalidate(key)
+            self._changed.notify_all()
+        if item is not None:
+            return item[1]
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data.keys())
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def items(self):
+        return [(key, value) for key, (version, value) in self._data.items()]
+
+    def values(self):
+        return [value for version, value in self._data.values()]
+
+    def copy(self):
+        return dict(self.items())
+
+    def clear(self):
+        with self._changed:
+            self._data.clear()
+            self._generation.value += 1
+            for i in range(len(self._change_counters)):
+                self._change_counters[i] += 1
+            self._changed.notify_all()
+
+    def version(self, key):
+        """Return the version of key's current value, or 0 if it isn't set."""
+        item = self._data.get(key)
+        return 0 if item is None else item[0]
+
+    def cached(self):
+        return CachedMessageBoard(self)
+
+    def __repr__(self):
+        return '<ManagerMessageBoard {}>'.format(self.copy())
+
+
+class CachedMessageBoard(MutableMapping):
+    """A view of a ManagerMessageBoard that keeps values read in this process
+
+    A cached value is reused for as long as the change counter of its key is
+    unchanged, so repeated reads of values that rarely change cost no IPC.
+    Writes go straight through to the board.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self._cache = dict()
+        self._pid = os.getpid()
+
+    def _lookup(self, key):
+        if self._pid != os.getpid():  # Don't trust anything cached before a fork.
+            self._cache = dict()
+            self._pid = os.getpid()
+        counter = self.board.change_counter(key)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == counter:
+            return cached[1]
+        # Read the counter before the value, so a concurrent write only ever makes the entry stale.
+        item = self.board._data.get(key)
+        self._cache[key] = (counter, item)
+        return item
+
+    def __getitem__(self, key):
+        item = self._lookup(key)
+        if item is None:
+            raise KeyError(key)
+        return item[1]
+
+    def get(self, key, default=None):
+        item = self._lookup(key)
+        return default if item is None else item[1]
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def __setitem__(self, key, value):
+        self._cache.pop(key, None)
+        self.board[key] = value
+
+    def __delitem__(self, key):
+        self._cache.pop(key, None)
+        del self.board[key]
+
+    def __iter__(self):
+        return iter(self.board)
+
+    def __len__(self):
+        return len(self.board)
+
+    def version(self, key):
+        item = self._lookup(key)
+        return 0 if item is None else item[0]
+
+    def wait_for(self, key, timeout=None):
+        return self.board.wait_for(key, timeout)
+
+    def subscribe(self, *keys):
+        return self.board.subscribe(*keys)
+
+    def __repr__(self):
+        return '<CachedMessageBoard {!r}>'.format(self.board)
+
+
+def _shared_memory_dir():
+    # Prefer tmpfs so the board never touches a disk.
+    return '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class _PerThread(object):
+    """MMapMessageBoard attribute kept per thread, created by default() on first use"""
+
+    def __init__(self, name, default=lambda: None):
+        self.name = name
+        self.default = default
+
+    def __get__(self, board, cls):
+        if board is None:
+            return self
+        if not hasattr(board._local, self.name):
+            setattr(board._local, self.name, self.default())
+        return getattr(board._local, self.name)
+
+    def __set__(self, board, value):
+        setattr(board._local, self.name, value)
+
+
+class MMapMessageBoard(MutableMapping, MessageBoardNotifications):
+
+    # flock() doesn't exclude threads sharing an open file, so each thread (e.g. the lanes of
+    # async_free and threaded_free workers) opens the file itself and keeps its own index.
+    _pid = _PerThread('pid')
+    _fd = _PerThread('fd')
+    _map = _PerThread('map')
+    _epoch = _PerThread('epoch')
+    _offset = _PerThread('offset', lambda: _header.size)
+    _index = _PerThread('index', dict)
+
+    def __init__(self, path, changed=None):
+        self.path = path
+        self._changed = changed
+        self._local = threading.local()
+
+    @classmethod
+    def create(cls, directory=None, size=1 << 20):
+        fd, path = tempfile.mkstemp(prefix='pytest-mp-board-', dir=directory or _shared_memory_dir())
+        try:
+            os.ftruncate(fd, size)
+            os.write(fd, _header.pack(_magic, _layout, 0, _header.size, 0, size))
+        finally:
+            os.close(fd)
+        return cls(path, multiprocessing.Condition())
+
+    def _open(self):
+        # flock() locks belong to the open file, so every process (and thread) needs its own.
+        if self._pid == os.getpid():
+            return
+        self._fd = os.open(self.path, os.O_RDWR)
+        self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+        self._pid = os.getpid()
+
+    def _lock(self, operation):
+        self._open()
+        fcntl.flock(self._fd, operation)
+
+    def _unlock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _read_header(self):
+        magic, layout, epoch, end, generation, capacity = _header.unpack_from(self._map, 0)
+        if magic != _magic or layout != _layout:
+            raise Exception('{} is not a pytest-mp message board.'.format(self.path))
+        return epoch, end, generation, capacity
+
+    def _sync(self):
+        """Bring the local index up to date.  Requires a lock."""
+        epoch, end, generation, capacity = self._read_header()
+        if capacity > len(self._map):
+            self._map.close()
+            self._map = mmap.mmap(self._fd, capacity)
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._offset = _header.size
+            self._index = dict()
+
+        offset = self._offset
+        while offset < end:
+            key_len, value_len, version, flags = _record.unpack_from(self._map, offset)
+            key_offset = offset + _record.size
+            key = pickle.loads(self._map[key_offset:key_offset + key_len])
+            if flags & _deleted:
+                self._index.pop(key, None)
+            else:
+                self._index[key] = (key_offset + key_len, value_len, version)
+            offset = key_offset + key_len + value_len
+        self._offset = offset
+        return generation
+
+    def _value(self, key):
+        value_offset, value_len, version = self._index[key]
+        return pickle.loads(self._map[value_offset:value_offset + value_len])
+
+    def _append(self, key, value, flags=0):
+        """Append a record for key.  Requires the exclusive lock."""
+        generation = self._sync() + 1
+        key_data = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+        value_data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL) if not flags & _deleted else b''
+        size = _record.size + len(key_data) + len(value_data)
+
+        epoch, end, _, capacity = self._read_header()
+        if end + size > capacity:
+            end = self._compact()
+            epoch, _, _, capacity = self._read_header()
+            if end + size > capacity:
+                capacity = max(capacity * 2, end + size)
+                os.ftruncate(self._fd, capacity)
+                self._map.close()
+                self._map = mmap.mmap(self._fd, capacity)
+
+        self._map[end:end + size] = _record.pack(len(key_data), len(value_data), generation, flags) + key_data + value_data
+        _header.pack_into(self._map, 0, _magic, _layout, epoch, end + size, generation, capacity)
+        self._sync()
+        return generation
+
+    def _compact(self):
+        """Rewrite only live records from the start of the log.  Requires the exclusive lock."""
+        live = []
+        for key, (value_offset, value_len, version) in self._index.items():
+            key_data = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+            live.append((version, key_data, self._map[value_offset:value_offset + value_len]))
+
+        epoch, end, generation, capacity = self._read_header()
+        offset = _header.size
+        for version, key_data, value_data in sorted(live, key=lambda x: x[0]):
+            record = _record.pack(len(key_data), len(value_data), version, 0) + key_data + value_data
+            self._map[offset:offset + len(record)] = record
+            offset += len(record)
+        _header.pack_into(self._map, 0, _magic, _layout, epoch + 1, offset, generation, capacity)
+        self._sync()
+        return offset
+
+    def __getitem__(self, key):
+        self._lock(fcntl.LOCK_SH)
+        try:
+            self._sync()
+            return self._value(key)
+        finally:
+            self._unlock()
+
+    def __setitem__(self, key, value):
+        self._lock(fcntl.LOCK_EX)
+        try:
+            self._append(key, value)
+        finally:
+            self._unlock()
+        self._notify()
+
+    def __delitem__(self, key):
+        self._lock(fcntl.LOCK_EX)
+        try:
+            self._sync()
+            if key not in self._index:
+                raise KeyError(key)
+            self._append(key, None, _deleted)
+        finally:
+            self._unlock()
+        self._notify()
+
+    # setdefault(), update(), pop() and popitem() each hold the exclusive lock throughout, like the
+    # Manager board's, rather than being a separate read and write through the MutableMapping mixins.
+
+    def setdefault(self, key, default=None):
+        self._lock(fcntl.LOCK_EX)
+        try:
+            self._sync()
+            if key in self._index:
+                return self._value(key)
+            self._append(key, default)
+        finally:
+            self._unlock()
+        self._notify()
+        return default
+
+    def update(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+        self._lock(fcntl.LOCK_EX)
+        try:
+            for key, value in values.items():
+                self._append(key, value)
+        finally:
+            self._unlock()
+        self._notify()
+
+    def popitem(self):
+        self._lock(fcntl.LOCK_EX)
+        try:
+            self._sync()
+            if not self._index:
+                raise KeyError('popitem(): message board is empty')
+            key = next(iter(self._index))
+            value = self._value(key)
+            self._append(key, None, _deleted)
+        finally:
+            self._unlock()
+        self._notify()
+        return key, value
+
+    def pop(self, key, *default):
+        self._lock(fcntl.LOCK_EX)
+        try:
+            self._sync()
+            if key not in self._index:
+                if default:
+                    return default[0]
+                raise KeyError(key)
+            value = self._value(key)
+            self._append(key, None, _deleted)
+        finally:
+            self._unlock()
+        self._notify()
+        return value
+
+    def __contains__(self, key):
+        self._lock(fcntl.LOCK_SH)
+        try:
+            self._sync()
+            return key in self._index
+        finally:
+            self._unlock()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        self._lock(fcntl.LOCK_SH)
+        try:
+            self._sync()
+            return len(self._index)
+        finally:
+            self._unlock()
+
+    def keys(self):
+        self._lock(fcntl.LOCK_SH)
+        try:
+            self._sync()
+            return list(self._index)
+        finally:
+            self._unlock()
+
+    def items(self):
+        self._lock(fcntl.LOCK_SH)
+        try:
+            self._sync()
+            return [(key, self._value(key)) for key in self._index]
+        finally:
+            self._unlock()
+
+    def values(self):
+        return [value for key, value in self.items()]
+
+    def copy(self):
+        return dict(self.items())
+
+    def clear(self):
+        self._lock(fcntl.LOCK_EX)
+        try:
+            self._sync()
+            for key in list(self._index):
+                self._append(key, None, _deleted)
+        finally:
+            self._unlock()
+        self._notify()
+
+    def version(self, key):
+        """Return the version of key's current value, or 0 if it isn't set."""
+        self._lock(fcntl.LOCK_SH)
+        try:
+            self._sync()
+            return self._index[key][2] if key in self._index else 0
+        finally:
+            self._unlock()
+
+    def cached(self):
+        """Reads are served from this process' index already, so the board is its own cached view."""
+        return self
+
+    def unlink(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map = self._fd = self._pid = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __getstate__(self):
+        return dict(path=self.path)
+
+    def __setstate__(self, state):
+        # The condition can't be pickled, so wait_for() and subscribe() fall back to polling.
+        self.__init__(state['path'])
+
+    def __repr__(self):
+        return '<MMapMessageBoard {}>'.format(self.path)
@@ -0,0 +1,76 @@
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+
+
+# Large read-only payloads shared between workers for mp_shared_buffer.
+# Each buffer is a file in a per-session directory that is published with an
+# atomic rename, so readers see either nothing or the complete payload, and
+# is mapped read-only by every process that reads it.  Mapped pages come from
+# the page cache, so no process holds its own copy.
+
+
+class SharedBuffers(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._views = dict()
+
+    @classmethod
+    def for_session(cls):
+        """Buffers in a new private directory, to be created before workers are forked"""
+        return cls(tempfile.mkdtemp(prefix='pytest-mp-buffers-'))
+
+    def path(self, name):
+        """Path of the file holding the named buffer, e.g. for numpy.memmap()"""
+        return os.path.join(self.directory, hashlib.sha1(name.encode('utf-8')).hexdigest())
+
+    def publish(self, name, data):
+        """Write bytes, bytearray, memoryview or array data once and return a read-only view of it"""
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.publishing-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(memoryview(data))
+            os.rename(temp_path, self.path(name))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._views.pop(name, None)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name in self._views:
+            return self._views[name]
+        try:
+            with open(self.path(name), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b''
+        except (IOError, OSError):
+            raise KeyError(name)
+        view = self._views[name] = memoryview(mapped)
+        return view
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return name in self._views or os.path.exists(self.path(name))
+
+    def cleanup(self):
+        # Views handed out stay valid: unlinked files live on while they are mapped.
+        self._views = dict()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __repr__(self):
+        return '<SharedBuffers {}>'.format(self.directory)
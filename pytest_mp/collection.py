@@ -0,0 +1,124 @@
+import compileall
+import fnmatch
+import multiprocessing
+import os
+import sys
+
+import py
+
+
+# Parallel warm-up of collection for --mp-collect.
+# Workers are forked from the collecting process and inherit its items, so the
+# parent still builds every item itself.  What doesn't have to happen in the
+# parent is compiling: before collection starts, the modules below the paths
+# being collected and the conftest files above them are split over --np
+# processes that assertion-rewrite the test modules and conftest files and
+# byte-compile the others into the same caches import uses.
+# With a cold cache (e.g. a fresh CI checkout) that is most of the collection
+# time of a large tree, and with a warm one each file costs a stat() or two.
+
+
+def collection_roots(config):
+    """The files and directories collection starts from: its args, otherwise testpaths, otherwise the rootdir"""
+    args = [str(x).split('::')[0] for x in config.args] or config.getini('testpaths') or [str(config.rootdir)]
+    roots = [os.path.abspath(os.path.join(str(config.invocation_dir), x)) for x in args]
+    return [x for x in roots if os.path.exists(x)]
+
+
+def conftests_above(path, rootdir):
+    """conftest.py files in the directories from rootdir down to the one holding path"""
+    files = []
+    directory = os.path.dirname(path)
+    while directory == rootdir or directory.startswith(rootdir + os.sep):
+        conftest = os.path.join(directory, 'conftest.py')
+        if os.path.isfile(conftest):
+            files.append(conftest)
+        if directory == rootdir:
+            break
+        directory = os.path.dirname(directory)
+    return files
+
+
+def collection_files(config):
+    """Modules collection will import as (path, rewrite) pairs, largest first"""
+    patterns = config.getini('python_files') + ['conftest.py']
+    norecurse = config.getini('norecursedirs')
+    rootdir = str(config.rootdir)
+    paths = set()
+    for root in collection_roots(config):
+        paths.update(conftests_above(root, rootdir))
+        if os.path.isfile(root):
+            if root.endswith('.py'):
+                paths.add(root)
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [x for x in dirnames if not any(fnmatch.fnmatch(x, pattern) for pattern in norecurse)
+                           and not os.path.exists(os.path.join(dirpath, x, 'pyvenv.cfg'))]
+            paths.update(os.path.join(dirpath, x) for x in filenames if x.endswith('.py'))
+    files = [(x, any(fnmatch.fnmatch(os.path.basename(x), pattern) for pattern in patterns)) for x in paths]
+    return sorted(files, key=lambda x: (-os.path.getsize(x[0]), x[0]))
+
+
+def partition_files(files, num_partitions):
+    """Spread files over num_partitions lists of about the same total size"""
+    partitions = [[] for _ in range(max(1, min(num_partitions, len(files))))]
+    sizes = [0] * len(partitions)
+    for path, rewrite in files:
+        smallest = sizes.index(min(sizes))
+        partitions[smallest].append((path, rewrite))
+        sizes[smallest] += os.path.getsize(path)
+    return partitions
+
+
+def assertion_state(config):
+    """The AssertionState of config if it rewrites asserts, otherwise None"""
+    from _pytest.assertion import rewrite
+    key = getattr(rewrite, 'assertstate_key', None)  # pytest 5.4+ keeps it in config._store.
+    state = config._store.get(key, None) if key is not None else getattr(config, '_assertstate', None)
+    return state if getattr(state, 'mode', None) == 'rewrite' else None
+
+
+def rewrite_file(config, state, path):
+    """Write the assertion rewritten pyc pytest would write when importing path"""
+    from _pytest.assertion import rewrite
+
+    source = py.path.local(path)
+    cache_dir = source.dirpath('__pycache__')
+    pyc = str(cache_dir.join(source.basename[:-3] + rewrite.PYC_TAIL))
+    if rewrite._read_pyc(source, pyc) is not None:
+        return
+    if rewrite._rewrite_test.__code__.co_varnames[0] == 'config':  # pytest < 5
+        source_stat, co = rewrite._rewrite_test(config, source)
+    else:
+        source_stat, co = rewrite._rewrite_test(str(source), config)
+    if co is not None:
+        cache_dir.ensure(dir=True)
+        rewrite._write_pyc(state, co, source_stat, pyc)
+
+
+def warm_files(config, files):
+    state = assertion_state(config)
+    for path, rewrite in files:
+        if not rewrite:
+            compileall.compile_file(path, quiet=1)
+        elif state is not None:
+            try:
+                rewrite_file(config, state, path)
+            except (EnvironmentError, SyntaxError, ValueError):
+                pass  # The parent's import of the broken module reports the error.
+
+
+def warm_collection(session, num_processes):
+    """Compile the modules collection will import in num_processes processes and return how many were used"""
+    if sys.dont_write_bytecode:
+        return 0
+    # Compiling is CPU bound, so there is no point in more processes than cpus.
+    partitions = partition_files(collection_files(session.config), min(num_processes, multiprocessing.cpu_count()))
+    if len(partitions) < 2:
+        return 0
+    processes = [multiprocessing.Process(target=warm_files, args=(session.config, files)) for files in partitions]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return len(processes)
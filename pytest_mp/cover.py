@@ -0,0 +1,62 @@
+import glob
+import os
+
+
+# Coverage measurement for --mp-cov.
+# Free tests each get a forked worker, so having every worker save its own
+# data file (as coverage's multiprocessing support and pytest-cov do) leaves
+# one file per test for `coverage combine`.  Instead workers measure into
+# memory and, once done, merge their data into one of --np slot files while
+# holding that slot's lock.  A slot is only busy while a worker merges into it,
+# so workers rarely wait, and the parent combines at most --np files at the end.
+
+
+class WorkerCoverage(object):
+
+    def __init__(self, source):
+        import coverage
+        self.source = source
+        self.cov = coverage.Coverage(source=source)
+        self.data_file = os.path.abspath(self.cov.get_option('run:data_file'))
+        self.prefix = '{}.mp{}-'.format(self.data_file, os.getpid())
+        self.combined = 0
+
+    def start(self):
+        self.cov.erase()
+        self.cov.start()
+
+    def stop_inherited(self):
+        """Stop measuring in a forked child that doesn't run tests"""
+        self.cov.stop()
+
+    def run_worker(self, slots, target, *args):
+        """Run target measuring coverage of this worker only, then merge it into a slot file"""
+        import coverage
+        self.cov.stop()  # The parent's, inherited by fork.
+        cov = coverage.Coverage(data_file=None, source=self.source)
+        cov.start()
+        try:
+            return target(*args)
+        finally:
+            cov.stop()
+            self.merge(cov.get_data(), slots)
+
+    def merge(self, data, slots):
+        from coverage import CoverageData
+        with slots:
+            slot = CoverageData(basename='{}{}'.format(self.prefix, slots.slot))
+            slot.read()
+            slot.update(data)
+            slot.write()
+
+    def slot_files(self):
+        return sorted(glob.glob(self.prefix + '*'))
+
+    def finish(self):
+        """Stop measuring and save the data of this process and every slot file as the data file"""
+        self.cov.stop()
+        slot_files = self.slot_files()
+        if slot_files:
+            self.cov.combine(data_paths=slot_files)
+        self.combined = len(slot_files)
+        self.cov.save()
@@ -0,0 +1,272 @@
+"""Keep pytest and the modules a project imports loaded between pytest runs.
+
+    python -m pytest_mp.daemon --preload mypackage &
+    pytest --mp-daemon --mp tests/test_something.py
+    python -m pytest_mp.daemon run --mp tests/test_something.py  # Without importing pytest here.
+
+The daemon imports pytest, its plugins and the --preload modules once, then
+serves invocations from the directory it was started in over a Unix socket.
+Each invocation runs in a fork of the daemon, so it starts with everything
+imported but otherwise as a fresh pytest run, with its output streamed back
+to `pytest --mp-daemon`.  When a preloaded module below that directory
+changes, the daemon restarts itself before serving the next invocation.
+"""
+import argparse
+import hashlib
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import time
+
+
+# Frames are a type byte and a 4 byte length, then data.  The client sends a
+# RUN frame, the daemon answers with OUTPUT frames and then EXIT or RESTART.
+RUN, OUTPUT, EXIT, RESTART = b'Q', b'O', b'X', b'R'
+header = struct.Struct('!cI')
+
+# Set in the fork running an invocation, so that it doesn't connect to its own daemon.
+serving = False
+
+
+def runtime_directory():
+    """A directory only this user can use, for the daemon sockets"""
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if directory and os.path.isdir(directory):
+        return directory
+    directory = os.path.join(tempfile.gettempdir(), 'pytest-mp-{}'.format(os.getuid()))
+    try:
+        os.mkdir(directory, 0o700)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise Exception('{} must be a directory only accessible by its owner, uid {}.'.format(directory, os.getuid()))
+    return directory
+
+
+def socket_path(directory):
+    digest = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(runtime_directory(), 'pytest-mp-{}.sock'.format(digest))
+
+
+def send_frame(conn, kind, data=b''):
+    conn.sendall(header.pack(kind, len(data)) + data)
+
+
+def recv_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise EOFError('pytest-mp daemon closed the connection.')
+        data += chunk
+    return data
+
+
+def recv_frame(conn):
+    kind, size = header.unpack(recv_exactly(conn, header.size))
+    return kind, recv_exactly(conn, size)
+
+
+def preload(modules):
+    """Import pytest, its plugins and modules, and return the preloaded local files with their mtimes"""
+    import pytest  # noqa
+    from _pytest.config import get_config
+    get_config().pluginmanager.load_setuptools_entrypoints('pytest11')
+    for module in modules:
+        __import__(module)
+
+    cwd = os.getcwd() + os.sep
+    files = dict()
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if not path:
+            continue
+        if path.endswith(('.pyc', '.pyo')):
+            path = path[:-1]
+        path = os.path.abspath(path)
+        if path.startswith(cwd) and os.path.exists(path):
+            files[path] = os.path.getmtime(path)
+    return files
+
+
+def changed(files):
+    for path, mtime in files.items():
+        if not os.path.exists(path) or os.path.getmtime(path) != mtime:
+            return path
+    return None
+
+
+def run_invocation(conn, request):
+    """Fork a child running pytest with the request's arguments and stream its output to conn"""
+    read_fd, write_fd = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        global serving
+        serving = True
+        code = 1
+        try:
+            os.setpgid(0, 0)  # So the invocation can be killed with the workers it started.
+            os.close(read_fd)
+            conn.close()
+            null = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(null, 0)
+            os.dup2(write_fd, 1)
+            os.dup2(write_fd, 2)
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            import pytest
+            code = pytest.main(request['args'])
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(int(code))
+
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass  # The child got there first.
+    os.close(write_fd)
+    try:
+        while True:
+            data = os.read(read_fd, 65536)
+            if not data:
+                break
+            send_frame(conn, OUTPUT, data)
+    except BaseException:
+        # The client is gone, so nobody is waiting for the rest of the run.
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+        raise
+    finally:
+        os.close(read_fd)
+        status = os.waitpid(pid, 0)[1]
+    code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+    send_frame(conn, EXIT, struct.pack('!i', code))
+
+
+def restart():
+    os.execv(sys.executable, [sys.executable, '-m', 'pytest_mp.daemon'] + sys.argv[1:])
+
+
+def serve(path, modules):
+    files = preload(modules)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Removes the socket on the way out.
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(16)
+    server.settimeout(1)
+    sys.stderr.write('pytest-mp daemon serving {} on {} with {} modules loaded.\n'
+                     .format(os.getcwd(), path, len(sys.modules)))
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                conn = None
+            try:
+                request = None
+                if conn is not None:
+                    conn.settimeout(None)
+                    request = json.loads(recv_frame(conn)[1].decode('utf-8'))
+                stale = changed(files)
+                if stale:
+                    sys.stderr.write('{} changed, restarting.\n'.format(stale))
+                    if conn is not None:
+                        send_frame(conn, RESTART)
+                        conn.close()
+                    server.close()
+                    os.unlink(path)
+                    restart()
+                if request is not None:
+                    run_invocation(conn, request)
+            except (EOFError, socket.error, ValueError) as e:
+                sys.stderr.write('Invocation failed: {}\n'.format(e))
+            finally:
+                if conn is not None:
+                    conn.close()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def run_remote(args, path, stdout=None, wait=10):
+    """Run pytest with args in the daemon listening on path and return its exit code.
+
+    Returns None, without having written anything, if no daemon is listening,
+    or if a restarting daemon isn't back within `wait` seconds.
+    """
+    stdout = stdout or sys.stdout
+    request = json.dumps(dict(args=args, cwd=os.getcwd(), env=dict(os.environ))).encode('utf-8')
+    deadline = time.time() + wait
+    restarting = False
+    while True:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                if os.stat(path).st_uid != os.getuid():
+                    return None  # Not this user's daemon, which would get our environment.
+                conn.connect(path)
+            except (OSError, socket.error):
+                if not restarting or time.time() >= deadline:
+                    return None
+                time.sleep(.1)
+                continue
+            try:
+                send_frame(conn, RUN, request)
+                kind, data = recv_frame(conn)
+            except (socket.error, EOFError):
+                # The daemon closed its socket to restart before accepting this connection.
+                kind, data = RESTART, b''
+            while kind == OUTPUT:
+                stdout.write(data.decode('utf-8', 'replace'))
+                stdout.flush()
+                kind, data = recv_frame(conn)
+            if kind == EXIT:
+                return struct.unpack('!i', data)[0]
+            restarting = True
+            if time.time() >= deadline:
+                return None
+        finally:
+            conn.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', help='Unix socket to listen on (defaults to one derived from the directory).')
+    parser.add_argument('--preload', action='append', default=[], metavar='MODULE',
+                        help='Module to import up front, e.g. the package under test. May be repeated.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['run']:
+        code = run_remote(argv[1:], socket_path(os.getcwd()))
+        if code is None:
+            sys.stderr.write('No pytest-mp daemon is serving {}.\n'.format(os.getcwd()))
+            return 1
+        return code
+    options = parse_args(argv)
+    serve(options.socket or socket_path(os.getcwd()), options.preload)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
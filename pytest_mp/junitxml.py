@@ -67,6 +67,14 @@ class MPLogXML(LogXML):
             time="%.3f" % suite_time_delta).unicode(indent=0))
         logfile.close()
 
+    def pytest_runtest_logreport(self, report):
+        if report.outcome == 'rerun':
+            reporter = self._opentestcase(report)
+            reporter._add_simple(Junit.rerunFailure, 'rerun {} ({})'.format(report.rerun, report.when),
+                                 report.longreprtext)
+            return
+        LogXML.pytest_runtest_logreport(self, report)
+
     def add_stats(self, key):
         with self.stats_lock:
             if key in self.stats:
@@ -0,0 +1,361 @@
+from contextlib import contextmanager
+import inspect
+import sys
+import threading
+
+from _pytest.fixtures import FixtureDef
+from _pytest.outcomes import TEST_OUTCOME
+import py
+import pytest
+
+try:
+    import contextvars
+    lane_context = contextvars.ContextVar('pytest_mp_lane')
+except ImportError:  # Python < 3.7
+    lane_context = None
+
+
+# Running the tests of one worker process concurrently in threads ("lanes").
+#
+# pytest assumes a single test runs at a time, so for the duration of a lane
+# run a few pieces of per-test state are made per-lane:
+#
+#  * the session's SetupState: collectors (modules, classes) are set up once
+#    and torn down after the last test, while each test's own finalizers stay
+#    with the test.  Setup is serialized so fixtures are only created once.
+#  * the cached value of function-scoped fixtures, which pytest keeps on the
+#    shared FixtureDef between setup and teardown.
+#  * stdout/stderr and log capture, which pytest does globally.
+#
+# Reports are passed to the reporters one at a time.  Coroutine tests run as
+# tasks on a shared event loop thread, so each task carries the lane awaiting
+# it in a context variable.  The lane stays blocked on its task, so every test
+# in flight costs a thread, and with setup serialized a slow fixture holds up
+# the lanes about to start.
+
+
+def current_lane():
+    """Ident of the lane running the caller, including tasks it awaits on the event loop"""
+    lane = lane_context.get(None) if lane_context is not None else None
+    return lane if lane is not None else threading.current_thread().ident
+
+
+class LaneSetupState(object):
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.collectors = []
+        self._finalizers = dict()
+
+    def addfinalizer(self, finalizer, colitem):
+        assert colitem and not isinstance(colitem, tuple)
+        assert callable(finalizer)
+        with self.lock:
+            self._finalizers.setdefault(colitem, []).append(finalizer)
+
+    def prepare(self, item):
+        with self.lock:
+            for col in item.listchain()[:-1]:
+                if col in self.collectors:
+                    if hasattr(col, '_prepare_exc'):
+                        py.builtin._reraise(*col._prepare_exc)
+                    continue
+                self.collectors.append(col)
+                try:
+                    col.setup()
+                except TEST_OUTCOME:
+                    col._prepare_exc = sys.exc_info()
+                    raise
+            item.setup()
+
+    def _teardown(self, colitem):
+        with self.lock:
+            finalizers = self._finalizers.pop(colitem, [])
+        exc = None
+        while finalizers:
+            try:
+                finalizers.pop()()
+            except TEST_OUTCOME:
+                if exc is None:
+                    exc = sys.exc_info()
+        try:
+            if hasattr(colitem, 'teardown'):
+                colitem.teardown()
+        except TEST_OUTCOME:
+            if exc is None:
+                exc = sys.exc_info()
+        if exc:
+            py.builtin._reraise(*exc)
+
+    def teardown_exact(self, item, nextitem):
+        # Collectors are shared by the other lanes, so only the test itself is torn down.
+        self._teardown(item)
+
+    def teardown_all(self):
+        exc = None
+        leftovers = [x for x in self._finalizers if x not in self.collectors]
+        for colitem in leftovers + list(reversed(self.collectors)):
+            try:
+                self._teardown(colitem)
+            except TEST_OUTCOME:
+                if exc is None:
+                    exc = sys.exc_info()
+        self.collectors = []
+        if exc:
+            py.builtin._reraise(*exc)
+
+
+class LaneFixtureState(object):
+    """FixtureDef attribute kept per lane (thread) for function-scoped fixtures.
+
+    Without a default, an attribute a lane hasn't set reads as the FixtureDef
+    was created with it: None if FixtureDef.__init__ sets it (pytest 5+),
+    missing otherwise.
+    """
+
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+        self.lanes = threading.local()
+
+    def _store(self, fixturedef):
+        if fixturedef.scope != 'function':
+            return fixturedef.__dict__
+        if not hasattr(self.lanes, 'store'):
+            self.lanes.store = dict()
+        return self.lanes.store.setdefault(id(fixturedef), dict())
+
+    def __get__(self, fixturedef, cls):
+        if fixturedef is None:
+            return self
+        store = self._store(fixturedef)
+        if self.name not in store:
+            if self.default is not None:
+                store[self.name] = self.default()
+            elif self.name in fixturedef.__dict__:
+                store[self.name] = None
+            else:
+                raise AttributeError(self.name)
+        return store[self.name]
+
+    def __set__(self, fixturedef, value):
+        self._store(fixturedef)[self.name] = value
+
+    def __delete__(self, fixturedef):
+        try:
+            del self._store(fixturedef)[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+
+class LaneOutput(object):
+    """Stand-in for sys.stdout/sys.stderr that keeps what each lane writes"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = dict()
+
+    def write(self, data):
+        buffer = self.buffers.get(current_lane())
+        (buffer if buffer is not None else self.stream).write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if current_lane() not in self.buffers:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextmanager
+    def capture(self):
+        lane = current_lane()
+        buffer = self.buffers[lane] = py.io.TextIO()
+        try:
+            yield buffer
+        finally:
+            del self.buffers[lane]
+
+
+class LaneReporting(object):
+    """Pass reports to the reporters one at a time"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_runtest_logstart(self):
+        with self.lock:
+            yield
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_runtest_logreport(self):
+        with self.lock:
+            yield
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_runtest_logfinish(self):
+        with self.lock:
+            yield
+
+
+class ThreadFilter(object):
+
+    def __init__(self):
+        self.lane = current_lane()
+
+    def filter(self, record):
+        return current_lane() == self.lane
+
+
+@contextmanager
+def lane_capture(config):
+    """Capture output and logs of each test per lane instead of globally"""
+    capman = config.pluginmanager.getplugin('capturemanager')
+    logging_plugin = config.pluginmanager.getplugin('logging-plugin')
+    stdout, stderr = LaneOutput(sys.stdout), LaneOutput(sys.stderr)
+
+    @contextmanager
+    def item_capture(when, item):
+        with stdout.capture() as out:
+            with stderr.capture() as err:
+                yield
+        item.add_report_section(when, 'stdout', out.getvalue())
+        item.add_report_section(when, 'stderr', err.getvalue())
+
+    original_runtest_for_main = getattr(logging_plugin, '_runtest_for_main', None)
+
+    @contextmanager
+    def runtest_for_main(item, when):
+        with original_runtest_for_main(item, when):
+            handler = getattr(item, 'catch_log_handler', None)
+            if handler is not None:
+                handler.addFilter(ThreadFilter())
+            yield
+
+    sys.stdout, sys.stderr = stdout, stderr
+    if capman is not None:
+        capman.item_capture = item_capture
+    if original_runtest_for_main is not None:
+        logging_plugin._runtest_for_main = runtest_for_main
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout.stream, stderr.stream
+        if capman is not None:
+            del capman.item_capture
+        if original_runtest_for_main is not None:
+            del logging_plugin._runtest_for_main
+
+
+@contextmanager
+def lanes(session):
+    """Make per-test state of the session per-lane until exited"""
+    setupstate = session._setupstate
+    session._setupstate = LaneSetupState()
+    FixtureDef.cached_result = LaneFixtureState('cached_result', None)
+    FixtureDef._finalizers = LaneFixtureState('_finalizers', list)
+    reporting = LaneReporting()
+    session.config.pluginmanager.register(reporting, 'mplanereporting')
+    try:
+        with lane_capture(session.config):
+            yield session._setupstate
+            session._setupstate.teardown_all()
+    finally:
+        session.config.pluginmanager.unregister(reporting)
+        del FixtureDef.cached_result
+        del FixtureDef._finalizers
+        session._setupstate = setupstate
+
+
+def run_in_lanes(session, items, concurrency, run_item, stop=None):
+    """Call run_item() for every item from up to `concurrency` threads.
+
+    Once stop(items started so far) is true no more items are started, and the
+    items that weren't are returned.
+    """
+    pending = list(reversed(items))
+    pending_lock = threading.Lock()
+    errors = []
+
+    def lane():
+        while not session.shouldstop and not errors:
+            with pending_lock:
+                if not pending or (stop and len(pending) < len(items) and stop(len(items) - len(pending))):
+                    return
+                item = pending.pop()
+            try:
+                run_item(item)
+            except BaseException:
+                errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=lane) for _ in range(min(concurrency, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        py.builtin._reraise(*errors[0])
+    return list(reversed(pending))
+
+
+def is_coroutine_test(item):
+    iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', None)  # Python 3.5+
+    return bool(iscoroutinefunction and iscoroutinefunction(getattr(item, 'obj', None)))
+
+
+class EventLoopThread(object):
+    """An asyncio event loop running in its own thread, shared by every lane of a worker.
+
+    Requires contextvars (Python 3.7+), without it each lane runs its own loop.
+    """
+
+    def __init__(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, coroutine):
+        """Run coroutine as a task on the loop and block the calling lane until it's done"""
+        import asyncio
+        context = contextvars.copy_context()
+        context.run(lane_context.set, current_lane())
+        return context.run(asyncio.run_coroutine_threadsafe, coroutine, self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class CoroutineCalls(object):
+    """Run the async def tests of async_free groups as tasks on the worker's event loop"""
+
+    def __init__(self, synchronization):
+        self.synchronization = synchronization
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_pyfunc_call(self, pyfuncitem):
+        group_info = pyfuncitem.get_closest_marker('mp_group_info')
+        if not group_info or group_info.kwargs['strategy'] != 'async_free' or not is_coroutine_test(pyfuncitem):
+            return None
+        testargs = dict((arg, pyfuncitem.funcargs[arg]) for arg in pyfuncitem._fixtureinfo.argnames)
+        run_coroutine(pyfuncitem.obj(**testargs), self.synchronization.get('event_loop'))
+        return True
+
+
+def run_coroutine(coroutine, event_loop=None):
+    if event_loop is not None and lane_context is not None:
+        return event_loop.run(coroutine)
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
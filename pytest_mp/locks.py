@@ -0,0 +1,200 @@
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+# Locks for mp_locks backed by flock() on files in a per-session directory.
+# The kernel does all the work, so acquiring and releasing never involves the
+# Manager server, and since locks are identified by path alone they can be
+# pickled into any worker, including ones started with 'spawn'.
+# Every acquire opens its own file descriptor, since flock() locks belong to
+# an open file and would otherwise be shared with forked children.  The
+# descriptor is kept per thread, so lanes of threaded_free and async_free
+# workers can share a lock object the way processes do.
+
+
+class FileLockBase(object):
+
+    poll_interval = .01
+
+    def __init__(self, path):
+        self.path = path
+        self._held = threading.local()
+
+    @property
+    def _fd(self):
+        return getattr(self._held, 'fd', None)
+
+    @_fd.setter
+    def _fd(self, fd):
+        self._held.fd = fd
+
+    def _held_already(self, blocking, timeout):
+        # Locks aren't reentrant, so the calling thread waiting on one it holds would never get it.
+        if self._fd is None:
+            return False
+        if blocking and timeout is None:
+            raise Exception('{} is already acquired by this thread.'.format(self))
+        return True
+
+    def _acquire(self, path, operation, blocking=True, timeout=None):
+        """Take the lock on path for the calling thread and return whether it was acquired"""
+        if self._held_already(blocking, timeout):
+            return False
+        fd = self._flock(path, operation, blocking, timeout)
+        if fd is None:
+            return False
+        self._fd = fd
+        return True
+
+    def _flock(self, path, operation, blocking=True, timeout=None):
+        """Return an fd holding the requested lock on path, or None if it couldn't be acquired"""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if blocking and timeout is None:
+                fcntl.flock(fd, operation)
+                return fd
+            deadline = time.time() + (timeout or 0)
+            while True:
+                try:
+                    fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                    return fd
+                except (IOError, OSError):
+                    if not blocking or time.time() >= deadline:
+                        break
+                time.sleep(self.poll_interval)
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+        return None
+
+    def _release(self):
+        if self._fd is None:
+            raise Exception('{} is not acquired.'.format(self))
+        fd, self._fd = self._fd, None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def release(self):
+        self._release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_held']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._held = threading.local()
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, self.path)
+
+
+class FileLock(FileLockBase):
+    """Exclusive lock with the multiprocessing.Lock interface"""
+
+    def acquire(self, blocking=True, timeout=None):
+        return self._acquire(self.path, fcntl.LOCK_EX, blocking, timeout)
+
+
+class FileRWLock(FileLockBase):
+    """Any number of readers or a single writer"""
+
+    def acquire(self, blocking=True, timeout=None, shared=False):
+        return self._acquire(self.path, fcntl.LOCK_SH if shared else fcntl.LOCK_EX, blocking, timeout)
+
+    @contextmanager
+    def read(self, timeout=None):
+        if not self.acquire(timeout=timeout, shared=True):
+            raise Exception('Timed out acquiring {} for reading.'.format(self))
+        try:
+            yield self
+        finally:
+            self.release()
+
+    @contextmanager
+    def write(self, timeout=None):
+        if not self.acquire(timeout=timeout):
+            raise Exception('Timed out acquiring {} for writing.'.format(self))
+        try:
+            yield self
+        finally:
+            self.release()
+
+
+class FileSemaphore(FileLockBase):
+    """Counting semaphore made of `value` slot files, each of which is an exclusive lock"""
+
+    def __init__(self, path, value):
+        FileLockBase.__init__(self, path)
+        self.value = value
+
+    @property
+    def slot(self):
+        """Index of the slot held by the calling thread, while acquired"""
+        return getattr(self._held, 'slot', None)
+
+    def acquire(self, blocking=True, timeout=None):
+        if self._held_already(blocking, timeout):
+            return False
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            for slot in range(self.value):
+                if self._acquire('{}.{}'.format(self.path, slot), fcntl.LOCK_EX, blocking=False):
+                    self._held.slot = slot
+                    return True
+            if not blocking or (deadline is not None and time.time() >= deadline):
+                return False
+            time.sleep(self.poll_interval)
+
+
+class FileLocks(object):
+    """Factory of named locks, shared by every process of a session"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def for_session(cls):
+        """Locks in a new private directory, to be created before workers are forked"""
+        return cls(tempfile.mkdtemp(prefix='pytest-mp-locks-'))
+
+    def _path(self, kind, name):
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+        return os.path.join(self.directory, '{}-{}'.format(kind, hashlib.sha1(name.encode('utf-8')).hexdigest()))
+
+    def lock(self, name):
+        return FileLock(self._path('lock', name))
+
+    def rwlock(self, name):
+        return FileRWLock(self._path('rwlock', name))
+
+    def semaphore(self, name, value=1):
+        if value < 1:
+            raise ValueError('Semaphore value must be positive.')
+        return FileSemaphore(self._path('semaphore', name), value)
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __repr__(self):
+        return '<FileLocks {}>'.format(self.directory)
@@ -0,0 +1,201 @@
+import collections
+
+import psutil
+
+
+# Scheduler dry run for --mp-plan.
+# Replays run_batched_tests() against recorded (or estimated) test durations
+# to predict the makespan of a run for a range of --np values.
+
+durations_key = 'mp/durations'
+default_duration = 1.0
+
+
+def record_durations(config, stats):
+    """Merge the total setup, call and teardown duration of each test into the cache"""
+    durations = config.cache.get(durations_key, {})
+    latest = dict()
+    for reports in stats.values():
+        for rep in reports[:]:
+            if getattr(rep, 'when', None) in ('setup', 'call', 'teardown') and not getattr(rep, 'mp_cached', False):
+                latest[rep.nodeid] = latest.get(rep.nodeid, 0.0) + rep.duration
+    if latest:
+        durations.update(latest)
+        config.cache.set(durations_key, durations)
+
+
+def load_durations(config):
+    return config.cache.get(durations_key, {}) if getattr(config, 'cache', None) else {}
+
+
+def estimate_durations(batches, recorded):
+    """Return durations for every batched test and how many of them were estimated"""
+    known = sorted(recorded.values())
+    estimate = known[len(known) // 2] if known else default_duration
+
+    durations = dict()
+    estimated = 0
+    for batch in batches.values():
+        for test in batch['tests']:
+            if test.nodeid in recorded:
+                durations[test.nodeid] = recorded[test.nodeid]
+            else:
+                durations[test.nodeid] = estimate
+                estimated += 1
+    return durations, estimated
+
+
+class Simulation(object):
+    """Greedy replay of the scheduler: units are submitted in order to the first free slot"""
+
+    def __init__(self, num_processes):
+        self.slots = [0.0] * num_processes
+        self.now = 0.0
+        self.busy = 0.0
+        self.groups = collections.OrderedDict()
+        self.barrier_idle = collections.OrderedDict()
+
+    def submit(self, group, strategy, duration):
+        slot = self.slots.index(min(self.slots))
+        start = max(self.now, self.slots[slot])
+        self.now = start
+        self.slots[slot] = start + duration
+        self.busy += duration
+
+        span = self.groups.setdefault(group, dict(strategy=strategy, start=start, end=start + duration, longest=0.0))
+        span['end'] = max(span['end'], start + duration)
+        span['longest'] = max(span['longest'], duration)
+
+    def barrier(self, group):
+        drained = max(self.slots + [self.now])
+        idle = sum(drained - x for x in self.slots)
+        self.barrier_idle[group] = self.barrier_idle.get(group, 0.0) + idle
+        self.slots = [drained] * len(self.slots)
+        self.now = drained
+
+    @property
+    def makespan(self):
+        return max(self.slots + [self.now])
+
+
+def lanes_makespan(durations, concurrency):
+    """Makespan of tests run by a single process in `concurrency` lanes"""
+    lanes = [0.0] * max(1, min(concurrency, len(durations)))
+    for duration in durations:
+        lanes[lanes.index(min(lanes))] += duration
+    return max(lanes)
+
+
+def simulate(batches, durations, num_processes, concurrency=None):
+    from pytest_mp.plugin import (batch_shards, default_concurrency, lane_slices, lane_strategies, shard_slices,
+                                  strategy_order)
+
+    simulation = Simulation(num_processes)
+    for name in sorted(batches, key=lambda x: strategy_order.get(batches[x]['strategy'], 4)):
+        strategy = batches[name]['strategy']
+        tests = [durations[test.nodeid] for test in batches[name]['tests']]
+        if strategy == 'free':
+            for duration in tests:
+                simulation.submit(name, strategy, duration)
+        elif strategy == 'serial':
+            simulation.submit(name, strategy, sum(tests))
+        elif strategy == 'isolated_free':
+            simulation.barrier(name)
+            for duration in tests:
+                simulation.submit(name, strategy, duration)
+            simulation.barrier(name)
+        elif strategy == 'isolated_serial':
+            simulation.barrier(name)
+            simulation.submit(name, strategy, sum(tests))
+            simulation.barrier(name)
+        elif strategy == 'sharded_serial':
+            for shard in shard_slices(batches[name]['tests'], batch_shards(batches[name], num_processes), durations):
+                simulation.submit(name, strategy, sum(durations[test.nodeid] for test in shard))
+        elif strategy in lane_strategies:
+            lanes = batches[name].get('options', {}).get('concurrency') or concurrency or default_concurrency
+            for durations_slice in lane_slices(tests, num_processes, lanes):
+                simulation.submit(name, strategy, lanes_makespan(durations_slice, lanes))
+        else:
+            raise Exception('Unknown strategy {}'.format(strategy))
+    return simulation
+
+
+def default_num_processes(configured):
+    values = set([configured]) if configured else set()
+    np = 1
+    while np <= 2 * psutil.cpu_count():
+        values.add(np)
+        np *= 2
+    return sorted(values)
+
+
+def parse_num_processes(value):
+    try:
+        values = sorted(set(int(x) for x in value.split(',') if x))
+    except ValueError:
+        raise ValueError('--mp-plan-np must be a comma separated list of integers.')
+    if not values or values[0] < 1:
+        raise ValueError('--mp-plan-np values must be positive.')
+    return values
+
+
+def dominant_groups(simulation, threshold=.25):
+    makespan = simulation.makespan
+    if not makespan:
+        return []
+
+    dominant = []
+    for name, span in simulation.groups.items():
+        idle = simulation.barrier_idle.get(name, 0.0)
+        if span['strategy'].startswith('isolated_'):
+            share = (span['end'] - span['start']) / makespan
+            if share < threshold and idle < threshold * makespan * len(simulation.slots):
+                continue
+            reason = 'its isolation barriers idle {:.2f}s of slot time'.format(idle)
+        elif span['strategy'] == 'serial':
+            share = span['longest'] / makespan
+            if share < threshold:
+                continue
+            reason = 'runs in a single process'
+        else:
+            # Free tests spread over every slot, so only a single long test can dominate.
+            share = span['longest'] / makespan
+            if share < threshold:
+                continue
+            unit = dict(free='test', sharded_serial='shard').get(span['strategy'], 'slice')
+            reason = 'its longest {} takes {:.2f}s'.format(unit, span['longest'])
+        dominant.append((name, span['strategy'], share, reason))
+    return dominant
+
+
+def write_plan(terminalreporter, batches, recorded, num_processes_list, configured, concurrency=None):
+    tr = terminalreporter
+    durations, estimated = estimate_durations(batches, recorded)
+    total = sum(durations.values())
+
+    tr.write_sep('=', 'pytest-mp plan')
+    tr.write_line('{} tests, {:.2f}s of test time ({} estimated)'.format(len(durations), total, estimated))
+
+    simulations = []
+    for num_processes in num_processes_list:
+        simulation = simulate(batches, durations, num_processes, concurrency)
+        simulations.append((num_processes, simulation))
+        makespan = simulation.makespan
+        utilization = 100.0 * simulation.busy / (num_processes * makespan) if makespan else 100.0
+        critical = ''
+        if simulation.groups:
+            name = max(simulation.groups, key=lambda x: simulation.groups[x]['end'] - simulation.groups[x]['start'])
+            span = simulation.groups[name]
+            critical = ', critical path {} ({}) {:.2f}s'.format(name, span['strategy'], span['end'] - span['start'])
+        tr.write_line('--np {:<4} makespan {:8.2f}s, utilization {:5.1f}%{}'.format(num_processes, makespan,
+                                                                                   utilization, critical))
+
+    num_processes, simulation = simulations[-1]
+    for candidate, candidate_simulation in simulations:
+        if candidate == configured:
+            num_processes, simulation = candidate, candidate_simulation
+    dominant = dominant_groups(simulation)
+    if dominant:
+        tr.write_line('groups dominating the timeline with --np {}:'.format(num_processes))
+    for name, strategy, share, reason in dominant:
+        tr.write_line('    {} ({}) takes {:.0f}% of the makespan: {}'.format(name, strategy, 100 * share, reason))
@@ -1,11 +1,27 @@
 from contextlib import contextmanager
+import multiprocessing.dummy
 import multiprocessing
 import collections
+import functools
+import signal
+import sys
+import threading
+import time
+import zlib
+import os
 
 from _pytest import main
+from _pytest.outcomes import TEST_OUTCOME
+from _pytest.runner import runtestprotocol, TestReport
 import psutil
+import py
 import pytest
 
+from pytest_mp.board import ManagerMessageBoard
+
+
+board_backends = ('manager', 'mmap')
+
 
 def pytest_addoption(parser):
     group = parser.getgroup('pytest-mp')
@@ -16,8 +32,82 @@ def pytest_addoption(parser):
     np_help = 'Set the concurrent worker amount (defaults to cpu count).  Value of 0 disables pytest-mp.'
     group.addoption('--np', '--num-processes', type=int, action='store', dest='num_processes', help=np_help)
 
+    report_help = 'Show a scheduler efficiency report (worker utilization, isolation barrier idle time) after the run.'
+    group.addoption('--mp-report', action='store_true', dest='mp_report', default=False, help=report_help)
+
+    resources_help = ('Record per-test CPU time, peak RSS and I/O in reports and JUnit properties '
+                      'and show the N most expensive tests (N=0 for all).')
+    group.addoption('--mp-resources', action='store', type=int, dest='mp_resources', default=None, metavar='N',
+                    help=resources_help)
+
+    fixture_profile_help = ('Time fixture setup and teardown in every test process and show the N most '
+                            'expensive fixtures across all workers (N=0 for all).')
+    group.addoption('--mp-fixture-profile', action='store', type=int, dest='mp_fixture_profile', default=None,
+                    metavar='N', help=fixture_profile_help)
+
+    plan_help = ('Collect and batch tests, then predict the makespan, utilization and critical path of the run '
+                 'from recorded test durations instead of running anything.')
+    group.addoption('--mp-plan', action='store_true', dest='mp_plan', default=False, help=plan_help)
+
+    plan_np_help = 'Comma separated --np values for --mp-plan (defaults to powers of two up to twice the cpu count).'
+    group.addoption('--mp-plan-np', action='store', dest='mp_plan_np', default=None, metavar='NP[,NP...]',
+                    help=plan_np_help)
+
+    board_help = ("Backend for mp_message_board: 'manager' (multiprocessing.Manager dict, default) or 'mmap' "
+                  "(memory-mapped file shared by all workers without a server round-trip).")
+    group.addoption('--mp-board', action='store', dest='mp_board', choices=board_backends, default=None,
+                    help=board_help)
+
+    concurrency_help = ('Tests run at once by each worker process of async_free and threaded_free groups (default {}), '
+                        'unless the group sets mp_group(..., concurrency=N).'.format(default_concurrency))
+    group.addoption('--mp-concurrency', action='store', type=int, dest='mp_concurrency', default=None, metavar='N',
+                    help=concurrency_help)
+
+    reruns_help = ('Rerun failed tests up to N times in the worker that ran them, unless the group sets '
+                   'mp_group(..., reruns=N).')
+    group.addoption('--mp-reruns', action='store', type=int, dest='mp_reruns', default=0, metavar='N',
+                    help=reruns_help)
+
+    collect_help = ('Before collecting, compile and assertion-rewrite the modules below the rootdir in --np '
+                    'processes, so that collection imports them from warm caches.')
+    group.addoption('--mp-collect', action='store_true', dest='mp_collect', default=False, help=collect_help)
+
+    cache_help = ('Skip tests that passed before, as long as their module, the local modules it imports, their '
+                  'conftest files and the environment are unchanged. Cached tests are reported as cached.')
+    group.addoption('--mp-cache', action='store_true', dest='mp_cache', default=False, help=cache_help)
+    group.addoption('--mp-cache-clear', action='store_true', dest='mp_cache_clear', default=False,
+                    help='Forget the results recorded for --mp-cache before running.')
+    group.addoption('--mp-cache-size', action='store', type=int, dest='mp_cache_size', default=None, metavar='N',
+                    help='Number of passing results --mp-cache keeps (default 100000).')
+
+    cov_help = ('Measure coverage of SOURCE (may be repeated, defaults to everything run) in the parent and every '
+                'worker, merging worker data into at most --np files combined at the end of the run.')
+    group.addoption('--mp-cov', action='append', nargs='?', const=True, dest='mp_cov', default=[],
+                    metavar='SOURCE', help=cov_help)
+
+    daemon_help = ('Run in the pytest-mp daemon started in this directory (python -m pytest_mp.daemon) if there is '
+                   'one, with pytest and preloaded modules already imported.')
+    group.addoption('--mp-daemon', action='store_true', dest='mp_daemon', default=False, help=daemon_help)
+
+    stream_help = ('Start running free tests of the modules collected so far while collection is still in '
+                   'progress. Ignored with -k, -m, --deselect, --lf and --ff.')
+    group.addoption('--mp-stream', action='store_true', dest='mp_stream', default=False, help=stream_help)
+
+    prewarm_help = ('Don\'t start the workers of an isolated group while the group before it is finishing, '
+                    'only once it has.')
+    group.addoption('--mp-no-prewarm', action='store_false', dest='mp_prewarm', default=True, help=prewarm_help)
+
+    group.addoption('--mp-max-tests-per-worker', action='store', type=int, dest='mp_max_tests_per_worker',
+                    default=None, metavar='N', help='Replace workers of serial and lane groups after N tests.')
+    group.addoption('--mp-max-worker-rss', action='store', type=float, dest='mp_max_worker_rss', default=None,
+                    metavar='MB', help='Replace workers whose resident set size reached MB megabytes.')
+    group.addoption('--mp-max-worker-age', action='store', type=float, dest='mp_max_worker_age', default=None,
+                    metavar='SECONDS', help='Replace workers that have been running tests for SECONDS.')
+
     parser.addini('mp', mp_help, type='bool', default=False)
     parser.addini('num_processes', np_help)
+    parser.addini('mp_board', board_help)
+    parser.addini('mp_cache_env', 'Environment variables whose values are part of --mp-cache keys.', type='linelist')
 
     # Includes pytest-instafail functionality
     # :copyright: (c) 2013-2016 by Janne Vanhala.
@@ -27,14 +117,50 @@ def pytest_addoption(parser):
                     help="show failures and errors instantly as they occur (disabled by default).")
 
 
-manager = multiprocessing.Manager()
-# Used for "global" synchronization access.
-synchronization = dict(manager=manager)
-synchronization['fixture_message_board'] = manager.dict()
-synchronization['fixture_lock'] = manager.Lock()
+@pytest.hookimpl(tryfirst=True)
+def pytest_load_initial_conftests(early_config):
+    # Start measuring before conftests import the code under test.
+    mp_cov = getattr(early_config.known_args_namespace, 'mp_cov', None)
+    if not mp_cov:
+        return
+    try:
+        from pytest_mp.cover import WorkerCoverage
+        cov = WorkerCoverage([x for x in mp_cov if x is not True] or None)
+    except ImportError:
+        raise Exception('--mp-cov requires coverage 5.0 or later.')
+    cov.start()
+    synchronization['coverage'] = cov
+    synchronization['coverage_owner'] = os.getpid()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_cmdline_main(config):
+    if not config.option.mp_daemon:
+        return
+    from pytest_mp import daemon
+    if daemon.serving:
+        return  # This is the daemon's fork running the invocation.
+    invocation_params = getattr(config, 'invocation_params', None)  # pytest 5.1+
+    args = list(invocation_params.args) if invocation_params else sys.argv[1:]
+    # None (no daemon is running) runs the tests in this process as usual.
+    return daemon.run_remote([x for x in args if x != '--mp-daemon'], daemon.socket_path(os.getcwd()))
+
+
+# Used for "global" synchronization access.  Populated in pytest_configure().
+synchronization = dict()
 
 state_fixtures = dict(use_mp=False, num_processes=None)
 
+strategies = ('free', 'serial', 'isolated_free', 'isolated_serial', 'async_free', 'threaded_free', 'sharded_serial')
+# Order in which groups are scheduled: isolated groups first, free groups last.
+strategy_order = dict(free=3, serial=2, sharded_serial=2, async_free=2, threaded_free=2, isolated_free=1,
+                      isolated_serial=0)
+# Strategies running a group's tests concurrently in lanes within each worker process
+lane_strategies = ('async_free', 'threaded_free')
+# mp_group() keyword arguments that tune how a group is run, e.g. mp_group('Name', 'async_free', concurrency=50)
+group_options = ('concurrency', 'shards', 'reruns', 'prewarm')
+default_concurrency = 10
+
 
 @pytest.fixture(scope='session')
 def mp_use_mp():
@@ -51,11 +177,55 @@ def mp_message_board():
     return synchronization['fixture_message_board']
 
 
+@pytest.fixture(scope='session')
+def mp_shared_buffer():
+    return session_storage('shared_buffers')
+
+
 @pytest.fixture(scope='session')
 def mp_lock():
     return synchronization['fixture_lock']
 
 
+@pytest.fixture(scope='session')
+def mp_locks():
+    return session_storage('locks')
+
+
+def session_storage(name):
+    """The session's SharedBuffers ('shared_buffers') or FileLocks ('locks'), created on first use"""
+    if name not in synchronization:
+        if name == 'shared_buffers':
+            from pytest_mp.buffers import SharedBuffers
+            synchronization[name] = SharedBuffers.for_session()
+        else:
+            from pytest_mp.locks import FileLocks
+            synchronization[name] = FileLocks.for_session()
+    return synchronization[name]
+
+
+class TrailStart(object):
+    """Value of an mp_trail 'start' event.
+
+    Truthy for the first consumer of a trail, which may publish a (picklable) `value`
+    that every following consumer receives once setup has finished.
+    """
+
+    def __init__(self, first, value=None):
+        self.first = first
+        self.value = value
+
+    def __bool__(self):
+        return self.first
+
+    __nonzero__ = __bool__
+
+
+def trail_condition(name):
+    conditions = synchronization['trail_conditions']
+    return conditions[zlib.crc32(name.encode('utf-8')) % len(conditions)]
+
+
 @pytest.fixture(scope='session')
 def mp_trail():
     message_board = synchronization['fixture_message_board']
@@ -66,25 +236,105 @@ def mp_trail():
             raise Exception('mp_trail state must be "start" or "finish": {}'.format(state))
 
         consumer_key = name + '__consumers__'
-        with synchronization['fixture_lock']:
-            if state == 'start':
-                if consumer_key not in message_board:
-                    message_board[consumer_key] = 1
-                    yield True
-                else:
-                    message_board[consumer_key] += 1
-                    yield False
-            else:
+        state_key = name + '__state__'
+        value_key = name + '__value__'
+        error_key = name + '__error__'
+        condition = trail_condition(name)
+
+        if state == 'finish':
+            with condition:
                 message_board[consumer_key] -= 1
-                if message_board[consumer_key]:
-                    yield False
-                else:
-                    del message_board[consumer_key]
-                    yield True
+                last = not message_board[consumer_key]
+                if last:
+                    # Keeps the trail from being started again until its teardown is done.
+                    message_board[state_key] = 'finishing'
+            if not last:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                with condition:
+                    for key in (consumer_key, state_key, value_key, error_key):
+                        message_board.pop(key, None)
+                    condition.notify_all()
+            return
+
+        with condition:
+            while message_board.get(state_key) == 'finishing':
+                condition.wait()
+            first = consumer_key not in message_board
+            if first:
+                message_board[consumer_key] = 1
+                message_board[state_key] = 'pending'
+            else:
+                message_board[consumer_key] += 1
+                # Only wait on this trail's readiness, not on any lock held during setup.
+                while message_board[state_key] == 'pending':
+                    condition.wait()
+                outcome = message_board[state_key]
+                value = message_board.get(value_key)
+                error = message_board.get(error_key)
+
+        if first:
+            start = TrailStart(True)
+            try:
+                yield start
+            except BaseException as e:
+                skipped = isinstance(e, pytest.skip.Exception)
+                with condition:
+                    message_board[error_key] = e.msg if skipped else '{}: {}'.format(type(e).__name__, e)
+                    message_board[state_key] = 'skipped' if skipped else 'error'
+                    condition.notify_all()
+                raise
+            with condition:
+                message_board[value_key] = start.value
+                message_board[state_key] = 'ready'
+                condition.notify_all()
+            return
+
+        if outcome == 'skipped':
+            pytest.skip(error)
+        if outcome == 'error':
+            raise Exception('mp_trail {} setup failed in another process: {}'.format(name, error))
+        yield TrailStart(False, value)
 
     return trail
 
 
+def mp_enabled(config):
+    """Whether tests will be distributed, decided like load_mp_options() without a session"""
+    option = config.option
+    if option.collectonly or option.mp_plan:
+        return False
+    if option.use_mp is None and not config.getini('mp'):
+        return False
+    num_processes = option.num_processes
+    if num_processes is None:
+        num_processes = config.getini('num_processes') or 'cpu_count'
+    return num_processes not in (0, '0')
+
+
+def start_synchronization():
+    """Start the Manager server and everything shared between test processes"""
+    manager = multiprocessing.Manager()
+    synchronization['manager'] = manager
+    synchronization['manager_message_board'] = ManagerMessageBoard(manager.dict())
+    synchronization['fixture_lock'] = manager.Lock()
+    # mp_trail names are striped over these so unrelated trails don't contend.
+    synchronization['trail_conditions'] = [multiprocessing.Condition() for _ in range(32)]
+
+
+def start_local_synchronization():
+    """In-process stand-ins for start_synchronization() when every test runs in this process"""
+    manager = multiprocessing.dummy.Manager()
+    synchronization['manager'] = manager
+    synchronization['manager_message_board'] = ManagerMessageBoard(
+        dict(), threading.Condition(), manager.Value('Q', 0), [0] * ManagerMessageBoard.num_change_counters)
+    synchronization['fixture_lock'] = threading.Lock()
+    synchronization['trail_conditions'] = [threading.Condition()]
+
+
 def load_mp_options(session):
     """Return use_mp, num_processes from pytest session"""
     if session.config.option.use_mp is None:
@@ -125,14 +375,15 @@ def get_item_batch_name_and_strategy(item):
     group_strategy = None
 
     marker_args = getattr(marker, 'args', None)
-    marker_kwargs = getattr(marker, 'kwargs', {})
+    marker_kwargs = dict((key, value) for key, value in getattr(marker, 'kwargs', {}).items()
+                         if key not in group_options)
 
     # In general, multiple mp_group decorations aren't supported.
     # This is a best effort, since kwargs will be overwritten.
     distilled = list(marker_args) + list(marker_kwargs.values())
     if len(distilled) > 2 \
        or (len(distilled) == 2 and 'strategy' not in marker_kwargs
-           and not any([x in distilled for x in ('free', 'isolated_free', 'serial', 'isolated_serial')])):
+           and not any([x in distilled for x in strategies])):
         raise Exception('Detected too many mp_group values for {}'.format(item.name))
 
     if marker_args:
@@ -147,6 +398,12 @@ def get_item_batch_name_and_strategy(item):
     return group_name, group_strategy
 
 
+def get_item_batch_options(item):
+    marker = item.get_closest_marker('mp_group')
+    kwargs = getattr(marker, 'kwargs', {})
+    return dict((key, kwargs[key]) for key in group_options if key in kwargs)
+
+
 def batch_tests(session):
     batches = collections.OrderedDict()
 
@@ -156,7 +413,7 @@ def batch_tests(session):
         if group_name is None:
             item.add_marker(pytest.mark.mp_group_info.with_args(group='ungrouped', strategy='free'))
             if 'ungrouped' not in batches:
-                batches['ungrouped'] = dict(strategy='free', tests=[])
+                batches['ungrouped'] = dict(strategy='free', tests=[], options=dict())
             batches['ungrouped']['tests'].append(item)
         else:
             if group_strategy is None:
@@ -165,9 +422,21 @@ def batch_tests(session):
                 raise Exception("{} already has specified strategy {}."
                                 .format(group_name, batches[group_name]['strategy']))
             if group_name not in batches:
-                batches[group_name] = dict(strategy=group_strategy, tests=[])
+                batches[group_name] = dict(strategy=group_strategy, tests=[], options=dict())
             item.add_marker(pytest.mark.mp_group_info.with_args(group=group_name, strategy=group_strategy))
             batches[group_name]['tests'].append(item)
+            batches[group_name]['options'].update(get_item_batch_options(item))
+
+    for group_name, batch in batches.items():
+        for test in batch['tests']:
+            unknown = [x for x in batch['options'].get('prewarm', ()) if x not in test.fixturenames]
+            if unknown:
+                raise Exception("{} prewarms {}, which {} doesn't request."
+                                .format(group_name, ', '.join(unknown), test.name))
+
+    if session.config.option.mp_cache and (state_fixtures.get('use_mp') or session.config.option.mp_plan):
+        from pytest_mp.results import skip_cached
+        synchronization['cached_tests'] = skip_cached(result_cache(session.config), batches)
 
     total_tests = 0
     for group in batches:
@@ -179,7 +448,32 @@ def batch_tests(session):
     return batches
 
 
+def result_cache(config):
+    if 'result_cache' not in synchronization:
+        from pytest_mp.results import ResultCache
+        synchronization['result_cache'] = ResultCache(config)
+    return synchronization['result_cache']
+
+
+def report_cached_test(test):
+    # A full passing setup/call/teardown sequence, so that JUnit XML and other reporters record the test.
+    test.ihook.pytest_runtest_logstart(nodeid=test.nodeid, location=test.location)
+    keywords = dict((x, 1) for x in test.keywords)
+    for when in ('setup', 'call', 'teardown'):
+        user_properties = [('mp_cached', True)] if when == 'teardown' else []
+        report = TestReport(test.nodeid, test.location, keywords, 'passed', None, when,
+                            user_properties=user_properties, mp_cached=True)
+        test.ihook.pytest_runtest_logreport(report=report)
+    test.ihook.pytest_runtest_logfinish(nodeid=test.nodeid, location=test.location)
+
+
+def record_worker_start():
+    if 'worker_started' in synchronization:
+        synchronization['worker_started'][multiprocessing.current_process().pid] = time.time()
+
+
 def run_test(test, next_test, session, finished_signal=None):
+    record_worker_start()
     test.config.hook.pytest_runtest_protocol(item=test, nextitem=next_test)
     if session.shouldstop:
         raise session.Interrupted(session.shouldstop)
@@ -198,53 +492,258 @@ def run_isolated_serial_batch(batch, final_test, session, finished_signal=None):
     return
 
 
-def submit_test_to_process(test, session):
-    proc = multiprocessing.Process(target=run_test, args=(test, None, session, synchronization['trigger_process_loop']))
+def worker_recycle_due(config, started, tests_run):
+    """Return why a worker that ran tests_run tests since started should be replaced, if it should"""
+    option = config.option
+    if option.mp_max_tests_per_worker and tests_run >= option.mp_max_tests_per_worker:
+        return 'tests'
+    if option.mp_max_worker_age and time.time() - started >= option.mp_max_worker_age:
+        return 'age'
+    if option.mp_max_worker_rss and psutil.Process().memory_info().rss >= option.mp_max_worker_rss * 1024 * 1024:
+        return 'rss'
+    return None
+
+
+def recycle_worker(tests_run, reason):
+    # The parent resubmits the tests that haven't run to a fresh worker once this one is reaped.
+    synchronization['recycled'][multiprocessing.current_process().pid] = (tests_run, reason)
+
+
+def flush_fixture_profile(config):
+    # Fixtures torn down after the last test's teardown, e.g. by a recycled worker, are timed too.
+    profiler = config.pluginmanager.get_plugin('mpfixtureprofile')
+    if profiler is not None:
+        profiler.flush()
+
+
+def prewarm_worker(release, fixtures, test, target, *args):
+    """Set up the fixtures of test that are safe to set up early, then wait for release to run target"""
+    request = getattr(test, '_request', None)
+    for name in fixtures if request is not None else ():
+        try:
+            request.getfixturevalue(name)
+        except TEST_OUTCOME:
+            break  # Raised again by the test's own setup.
+    release.wait()
+    return target(*args)
+
+
+def start_process(target, args, tests, resubmit=None, prewarm=None):
+    group_info = tests[0].get_closest_marker('mp_group_info').kwargs
+    if prewarm:
+        target, args = prewarm_worker, (prewarm['release'], prewarm['fixtures'], tests[0], target) + args
+    if 'coverage' in synchronization:
+        target, args = synchronization['coverage'].run_worker, (synchronization['coverage_slots'], target) + args
+    proc = multiprocessing.Process(target=target, args=args)
     with synchronization['processes_lock']:
+        spawned = time.time()
         proc.start()
         pid = proc.pid
         synchronization['running_pids'][pid] = True
         synchronization['processes'][pid] = proc
+    synchronization['workers'][pid] = dict(group=group_info['group'], strategy=group_info['strategy'],
+                                           tests=len(tests), spawned=spawned)
+    if resubmit:
+        synchronization['tails'][pid] = (tests, resubmit)
     synchronization['trigger_process_loop'].set()
+    return pid
+
 
+def submit_test_to_process(test, session, prewarm=None):
+    return start_process(run_test, (test, None, session, synchronization['trigger_process_loop']), [test],
+                         prewarm=prewarm)
 
-def submit_batch_to_process(batch, session):
+
+def submit_batch_to_process(batch, session, prewarm=None):
 
     def run_batch(tests, finished_signal):
+        record_worker_start()
+        started = time.time()
+        pid = multiprocessing.current_process().pid
+        progress = synchronization['progress']
         for i, test in enumerate(tests):
             next_test = tests[i + 1] if i + 1 < len(tests) else None
+            progress[pid] = i  # Lets the parent tell which test was running should this process die.
             test.config.hook.pytest_runtest_protocol(item=test, nextitem=next_test)
             if session.shouldstop:
+                del progress[pid]
                 raise session.Interrupted(session.shouldstop)
+            reason = next_test and worker_recycle_due(session.config, started, i + 1)
+            if reason:
+                session._setupstate.teardown_all()
+                flush_fixture_profile(session.config)
+                recycle_worker(i + 1, reason)
+                break
+        del progress[pid]
         finished_signal.set()
 
-    proc = multiprocessing.Process(target=run_batch, args=(batch['tests'], synchronization['trigger_process_loop']))
-    with synchronization['processes_lock']:
-        proc.start()
-        pid = proc.pid
-        synchronization['running_pids'][pid] = True
-        synchronization['processes'][pid] = proc
-    synchronization['trigger_process_loop'].set()
+    return start_process(run_batch, (batch['tests'], synchronization['trigger_process_loop']), batch['tests'],
+                         lambda tests: submit_batch_to_process(dict(batch, tests=tests), session), prewarm)
+
+
+def submit_lanes_to_process(tests, session, concurrency, event_loop=False):
+
+    def run_lanes(tests, finished_signal):
+        record_worker_start()
+        started = time.time()
+        reasons = []
+
+        def recycle_due(tests_run):
+            reason = worker_recycle_due(session.config, started, tests_run)
+            if reason:
+                reasons.append(reason)
+            return reason
+
+        from pytest_mp import lanes
+        if event_loop:
+            synchronization['event_loop'] = lanes.EventLoopThread()
+        try:
+            with lanes.lanes(session):
+                remaining = lanes.run_in_lanes(
+                    session, tests, concurrency,
+                    lambda test: test.config.hook.pytest_runtest_protocol(item=test, nextitem=None), recycle_due)
+        finally:
+            if event_loop:
+                synchronization.pop('event_loop').close()
+        flush_fixture_profile(session.config)
+        if session.shouldstop:
+            raise session.Interrupted(session.shouldstop)
+        if remaining:
+            recycle_worker(len(tests) - len(remaining), reasons[-1])
+        finished_signal.set()
+
+    start_process(run_lanes, (tests, synchronization['trigger_process_loop']), tests,
+                  lambda tests: submit_lanes_to_process(tests, session, concurrency, event_loop))
+
+
+def lane_slices(tests, num_processes, concurrency):
+    """Split tests into contiguous slices for as many processes as it takes to fill `concurrency` lanes each"""
+    num_slices = max(1, min(num_processes, -(-len(tests) // concurrency)))
+    size, extra = divmod(len(tests), num_slices)
+    slices = []
+    start = 0
+    for i in range(num_slices):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(tests[start:end])
+        start = end
+    return slices
+
+
+def shard_slices(tests, shards, durations):
+    """Split tests into `shards` contiguous slices of about the same total duration"""
+    shards = max(1, min(shards, len(tests)))
+    total = float(sum(durations[test.nodeid] for test in tests))
+    slices = [[]]
+    elapsed = 0.0
+    for i, test in enumerate(tests):
+        remaining_tests = len(tests) - i
+        remaining_shards = shards - len(slices)
+        if slices[-1] and remaining_shards \
+           and (elapsed >= total * len(slices) / shards or remaining_tests == remaining_shards):
+            slices.append([])
+        slices[-1].append(test)
+        elapsed += durations[test.nodeid]
+    return slices
+
+
+def batch_shards(batch, num_processes):
+    return batch.get('options', {}).get('shards') or num_processes
+
+
+def batch_concurrency(batch, config):
+    return batch.get('options', {}).get('concurrency') or config.option.mp_concurrency or default_concurrency
+
+
+def describe_exitcode(exitcode):
+    if exitcode is not None and exitcode < 0:
+        names = dict((getattr(signal, name), name) for name in dir(signal)
+                     if name.startswith('SIG') and not name.startswith('SIG_'))
+        return 'signal {}'.format(names.get(-exitcode, -exitcode))
+    return 'exit code {}'.format(exitcode)
+
+
+def report_crashed_test(test, pid, exitcode):
+    longrepr = 'Worker {} running this test exited unexpectedly with {}.'.format(pid, describe_exitcode(exitcode))
+    keywords = dict((x, 1) for x in test.keywords)
+    for when, outcome in (('call', 'failed'), ('teardown', 'passed')):
+        report = TestReport(test.nodeid, test.location, keywords, outcome, longrepr if outcome == 'failed' else None,
+                            when)
+        test.ihook.pytest_runtest_logreport(report=report)
 
 
 def reap_finished_processes():
+    """Join finished workers, replacing recycled and crashed ones, and return how many were replaced"""
     with synchronization['processes_lock']:
-        pid_list = list(synchronization['finished_pids'].keys())
+        finished = synchronization['finished_pids'].copy()
         synchronization['finished_pids'].clear()
 
-    for pid in pid_list:
-        synchronization['processes'][pid].join()
-        del synchronization['processes'][pid]
+    replaced = 0
+    for pid in finished:
+        proc = synchronization['processes'].pop(pid)
+        proc.join()
+        worker = synchronization['workers'][pid]
+        worker.update(finished=finished[pid], reaped=time.time())
+        if worker.get('streamed'):
+            continue
+        tests, resubmit = synchronization['tails'].pop(pid, (None, None))
+        tail = None
+        if pid in synchronization['recycled']:
+            tests_run, worker['recycled'] = synchronization['recycled'].pop(pid)
+            tail = tests[tests_run:]
+        elif pid in synchronization['progress']:
+            # The worker died in the middle of a batch: fail the test it was running and resubmit the rest.
+            running = synchronization['progress'].pop(pid)
+            worker['crashed'] = describe_exitcode(proc.exitcode)
+            report_crashed_test(tests[running], pid, proc.exitcode)
+            tail = tests[running + 1:]
+        if tail:
+            synchronization['shared_fixtures'].respawned(worker['group'])
+            wait_until_can_submit(synchronization['num_processes'])
+            resubmit(tail)
+            replaced += 1
+        synchronization['shared_fixtures'].reaped(worker['group'])
+    return replaced
 
 
 def wait_until_no_running():
     wait_until_can_submit(1)
 
 
+def wait_until_drained():
+    """Wait for every worker but held back prewarmed ones, including replacements of recycled ones, and reap them.
+
+    Prewarmed workers not started yet are started on the slots freed in the meantime.
+    """
+    while True:
+        while True:
+            start_prewarmed()
+            with synchronization['processes_lock']:
+                if not running_workers():
+                    break
+            synchronization['process_finished'].wait()
+            synchronization['process_finished'].clear()
+        if not reap_finished_processes():
+            start_prewarmed()
+            return
+
+
+def isolation_barrier(group, when):
+    start = time.time()
+    wait_until_drained()
+    synchronization['barriers'].append(dict(group=group, when=when, start=start, end=time.time()))
+
+
+def running_workers():
+    """Number of running workers, not counting prewarmed ones waiting for their group (call with processes_lock)"""
+    running_pids = synchronization['running_pids']
+    prewarmed = synchronization.get('prewarmed')
+    return len(running_pids) - len([x for x in (prewarmed['pids'] if prewarmed else ()) if x in running_pids])
+
+
 def wait_until_can_submit(num_processes):
     while True:
         with synchronization['processes_lock']:
-            num_pids = len(synchronization['running_pids'])
+            num_pids = running_workers()
 
         if num_pids < num_processes:
             return
@@ -253,10 +752,48 @@ def wait_until_can_submit(num_processes):
         synchronization['process_finished'].clear()
 
 
-def run_batched_tests(batches, session, num_processes):
-    sorting = dict(free=3, serial=2, isolated_free=1, isolated_serial=0)
+def prewarm_group(name, batch, session, num_processes):
+    """Plan the first workers of an isolated group, held back until its isolation barrier is passed"""
+    if synchronization['shared_fixtures'].needed.get(name):
+        return None  # Shared fixtures are set up by the parent once the group is dispatched.
+    prewarm = dict(release=multiprocessing.Event(), fixtures=list(batch['options'].get('prewarm', ())), pids=[])
+    if batch['strategy'] == 'isolated_serial':
+        prewarm['pending'] = [functools.partial(submit_batch_to_process, batch, session, prewarm)]
+    else:
+        prewarm['pending'] = [functools.partial(submit_test_to_process, test, session, prewarm)
+                              for test in batch['tests'][:num_processes]]
+    return prewarm
+
+
+def start_prewarmed():
+    """Start planned prewarmed workers on the slots that are free right now, counting them against --np"""
+    prewarmed = synchronization.get('prewarmed')
+    while prewarmed and prewarmed['pending']:
+        with synchronization['processes_lock']:
+            if len(synchronization['running_pids']) >= synchronization['num_processes']:
+                return
+        prewarmed['pids'].append(prewarmed['pending'].pop(0)())
 
-    batch_names = sorted(batches.keys(), key=lambda x: sorting.get(batches[x]['strategy'], 4))
+
+def release_prewarmed(prewarmed):
+    # Prewarmed workers take up their slot from here on, as far as --mp-report is concerned.
+    released = time.time()
+    for pid in prewarmed['pids']:
+        worker = synchronization['workers'][pid]
+        worker['prewarmed'], worker['spawned'] = worker['spawned'], released
+    prewarmed['release'].set()
+
+
+def discard_prewarmed():
+    prewarmed = synchronization.pop('prewarmed', None)
+    for pid in prewarmed['pids'] if prewarmed else ():
+        proc = synchronization['processes'].get(pid)
+        if proc is not None:
+            proc.terminate()
+
+
+def run_batched_tests(batches, session, num_processes):
+    batch_names = sorted(batches.keys(), key=lambda x: strategy_order.get(batches[x]['strategy'], 4))
 
     if not num_processes:
         for i, batch in enumerate(batch_names):
@@ -264,37 +801,76 @@ def run_batched_tests(batches, session, num_processes):
             run_isolated_serial_batch(batches[batch], next_test, session)
         return
 
-    for batch in batch_names:
+    try:
+        run_batches(batches, batch_names, session, num_processes)
+    finally:
+        discard_prewarmed()  # e.g. when the run was interrupted before their group
+
+    wait_until_drained()
+
+
+def run_batches(batches, batch_names, session, num_processes):
+    shared_fixtures = synchronization['shared_fixtures']
+    for i, batch in enumerate(batch_names):
         strategy = batches[batch]['strategy']
-        if strategy == 'free':
-            for test in batches[batch]['tests']:
+        next_batch = batch_names[i + 1] if i + 1 < len(batch_names) else None
+        if strategy in lane_strategies:
+            concurrency = batch_concurrency(batches[batch], session.config)
+            slices = lane_slices(batches[batch]['tests'], num_processes, concurrency)
+            shared_fixtures.dispatch(batch, len(slices))
+            for tests in slices:
                 wait_until_can_submit(num_processes)
-                submit_test_to_process(test, session)
+                submit_lanes_to_process(tests, session, concurrency, event_loop=strategy == 'async_free')
                 reap_finished_processes()
-        elif strategy == 'serial':
-            wait_until_can_submit(num_processes)
-            submit_batch_to_process(batches[batch], session)
-            reap_finished_processes()
-        elif strategy == 'isolated_free':
-            wait_until_no_running()
+            continue
+
+        if strategy == 'sharded_serial':
+            from pytest_mp import plan
+            durations, _ = plan.estimate_durations({batch: batches[batch]}, plan.load_durations(session.config))
+            shards = shard_slices(batches[batch]['tests'], batch_shards(batches[batch], num_processes), durations)
+            shared_fixtures.dispatch(batch, len(shards))
+            for tests in shards:
+                wait_until_can_submit(num_processes)
+                submit_batch_to_process(dict(batches[batch], tests=tests), session)
+                reap_finished_processes()
+            continue
+
+        shared_fixtures.dispatch(batch, len(batches[batch]['tests']) if strategy.endswith('free') else 1)
+        if strategy in ('isolated_free', 'isolated_serial'):
+            # Workers of this group started early wait for the release, the ones of the next group are
+            # started early while this one finishes.
+            isolation_barrier(batch, 'before')
+            prewarmed = synchronization.pop('prewarmed', None) or dict(pids=[])
+            if prewarmed['pids']:
+                release_prewarmed(prewarmed)
+            if strategy == 'isolated_free':
+                for test in batches[batch]['tests'][len(prewarmed['pids']):]:
+                    wait_until_can_submit(num_processes)
+                    submit_test_to_process(test, session)
+                    reap_finished_processes()
+            elif not prewarmed['pids']:
+                submit_batch_to_process(batches[batch], session)
+                reap_finished_processes()
+            if (session.config.option.mp_prewarm and next_batch
+                    and batches[next_batch]['strategy'] in ('isolated_free', 'isolated_serial')):
+                synchronization['prewarmed'] = prewarm_group(next_batch, batches[next_batch], session, num_processes)
+            isolation_barrier(batch, 'after')
+        elif strategy == 'free':
             for test in batches[batch]['tests']:
                 wait_until_can_submit(num_processes)
                 submit_test_to_process(test, session)
                 reap_finished_processes()
-            wait_until_no_running()
-        elif strategy == 'isolated_serial':
-            wait_until_no_running()
+        elif strategy == 'serial':
+            wait_until_can_submit(num_processes)
             submit_batch_to_process(batches[batch], session)
             reap_finished_processes()
-            wait_until_no_running()
         else:
             raise Exception('Unknown strategy {}'.format(strategy))
 
-    wait_until_no_running()
-    reap_finished_processes()
-
 
 def process_loop(num_processes):
+    if 'coverage' in synchronization:
+        synchronization['coverage'].stop_inherited()
     while True:
         triggered = synchronization['trigger_process_loop'].wait(.1)
         if triggered:
@@ -316,7 +892,7 @@ def process_loop(num_processes):
                 continue
             with synchronization['processes_lock']:
                 del synchronization['running_pids'][pid]
-                synchronization['finished_pids'][pid] = True
+                synchronization['finished_pids'][pid] = time.time()
 
             synchronization['process_finished'].set()
             num_pids -= 1
@@ -325,40 +901,182 @@ def process_loop(num_processes):
             return
 
 
+def start_scheduler(config, num_processes):
+    manager = synchronization['manager']
+    synchronization['stats'] = manager.dict()
+    synchronization['stats_lock'] = multiprocessing.Lock()
+    synchronization['stats']['failed'] = False
+
+    synchronization['trigger_process_loop'] = multiprocessing.Event()
+    synchronization['trigger_process_loop'].set()
+    synchronization['process_finished'] = multiprocessing.Event()
+    synchronization['reap_process_loop'] = multiprocessing.Event()
+    synchronization['processes_lock'] = multiprocessing.Lock()
+    synchronization['running_pids'] = manager.dict()
+    synchronization['finished_pids'] = manager.dict()
+    synchronization['processes'] = dict()
+    synchronization['workers'] = dict()
+    synchronization['num_processes'] = num_processes
+    synchronization['recycled'] = manager.dict()
+    synchronization['progress'] = manager.dict()
+    synchronization['tails'] = dict()
+    synchronization['barriers'] = []
+    synchronization.pop('worker_started', None)
+    if config.option.mp_report:
+        synchronization['worker_started'] = manager.dict()
+    if 'coverage' in synchronization:
+        synchronization['coverage_slots'] = session_storage('locks').semaphore('mp-cov', num_processes)
+
+    synchronization['process_loop'] = multiprocessing.Process(target=process_loop, args=(num_processes,))
+    synchronization['process_loop'].start()
+    synchronization['run_start'] = time.time()
+
+
+def stop_scheduler():
+    wait_until_drained()
+    synchronization['reap_process_loop'].set()
+    synchronization.pop('process_loop').join()
+
+
+def modifies_items(plugin):
+    """Whether a plugin other than pytest's own and this one implements pytest_collection_modifyitems"""
+    name = getattr(plugin, '__name__', None) or type(plugin).__module__
+    return not name.startswith(('_pytest.', 'pytest_mp.'))
+
+
+def streaming_allowed(config):
+    # Streamed tests run before pytest_collection_modifyitems could deselect or skip them.
+    option = config.option
+    if (option.keyword or option.markexpr or getattr(option, 'deselect', None) or getattr(option, 'lf', False)
+            or getattr(option, 'failedfirst', False) or getattr(option, 'stepwise', False)):
+        return False
+    hookimpls = config.pluginmanager.hook.pytest_collection_modifyitems.get_hookimpls()
+    return not any(modifies_items(x.plugin) for x in hookimpls)
+
+
+def stream_item(item, session):
+    """Queue a collected test to be run right away if it is free and doesn't use shared fixtures"""
+    try:
+        group_name, group_strategy = get_item_batch_name_and_strategy(item)
+    except Exception:
+        return  # Reported by batch_tests() once collection is done.
+    if group_name is None:
+        group_name, group_strategy = 'ungrouped', 'free'
+    if group_strategy != 'free':
+        return  # Including groups whose strategy another test may still declare.
+    if session.config.option.mp_cache and result_cache(session.config).passed(item):
+        return
+    from pytest_mp.shared import shared_function
+    if any(shared_function(session, argname, item.nodeid) for argname in item.fixturenames):
+        return
+    synchronization['stream']['pending'].append((item, group_name))
+
+
+def stream_tests(session):
+    """Start pending streamed tests on the worker slots that are free right now"""
+    stream = synchronization['stream']
+    reap_finished_processes()
+    if not streaming_allowed(session.config):
+        stream['pending'] = []  # A conftest collected since implements pytest_collection_modifyitems.
+    while stream['pending']:
+        with synchronization['processes_lock']:
+            if len(synchronization['running_pids']) >= synchronization['num_processes']:
+                return
+        test, group_name = stream['pending'].pop(0)
+        test.add_marker(pytest.mark.mp_group_info.with_args(group=group_name, strategy='free'))
+        pid = submit_test_to_process(test, session)
+        synchronization['workers'][pid]['streamed'] = True
+        stream['started'].add(test.nodeid)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection(session):
+    if not mp_enabled(session.config):
+        return
+    if session.config.option.mp_collect:
+        from pytest_mp.collection import warm_collection
+        warm_collection(session, load_mp_options(session)[1])
+    if session.config.option.mp_stream and streaming_allowed(session.config):
+        start_scheduler(session.config, load_mp_options(session)[1])
+        synchronization['stream'] = dict(session=session, pending=[], started=set())
+
+
+def pytest_itemcollected(item):
+    if 'stream' in synchronization:
+        stream_item(item, synchronization['stream']['session'])
+
+
+def pytest_collectstart(collector):
+    # Items of a module are all collected by the time the next collector starts.
+    if 'stream' in synchronization:
+        stream_tests(synchronization['stream']['session'])
+
+
+def report_shared_teardown_errors(session, errors):
+    if not errors:
+        return
+    session.testsfailed += len(errors)
+    terminalreporter = session.config.pluginmanager.get_plugin('terminalreporter')
+    if terminalreporter is not None:
+        terminalreporter.write_sep('=', 'mp_shared_fixture teardown errors', red=True)
+        for error in errors:
+            terminalreporter.write_line(error)
+
+
 def pytest_runtestloop(session):
+    stream = synchronization.pop('stream', None)
     if (session.testsfailed and not session.config.option.continue_on_collection_errors):
+        if stream:
+            stop_scheduler()
         raise session.Interrupted("{} errors during collection".format(session.testsfailed))
 
     if session.config.option.collectonly:
         return True
 
+    synchronization.pop('run_end', None)
     use_mp, num_processes = load_mp_options(session)
 
     batches = batch_tests(session)
+    if any(batch['strategy'] == 'async_free' for batch in batches.values()):
+        from pytest_mp.lanes import CoroutineCalls
+        session.config.pluginmanager.register(CoroutineCalls(synchronization), 'mpcoroutinecalls')
+
+    if session.config.option.mp_plan:
+        from pytest_mp import plan
+        configured = session.config.option.num_processes or num_processes
+        if session.config.option.mp_plan_np:
+            num_processes_list = plan.parse_num_processes(session.config.option.mp_plan_np)
+        else:
+            num_processes_list = plan.default_num_processes(configured)
+        terminalreporter = session.config.pluginmanager.get_plugin('terminalreporter')
+        plan.write_plan(terminalreporter, batches, plan.load_durations(session.config), num_processes_list,
+                        configured, session.config.option.mp_concurrency)
+        return True
 
     if not use_mp or not num_processes:
         return main.pytest_runtestloop(session)
 
-    synchronization['stats'] = manager.dict()
-    synchronization['stats_lock'] = multiprocessing.Lock()
-    synchronization['stats']['failed'] = False
+    if stream:
+        for name in list(batches):
+            batches[name]['tests'] = [x for x in batches[name]['tests'] if x.nodeid not in stream['started']]
+            if not batches[name]['tests']:
+                del batches[name]
+    else:
+        start_scheduler(session.config, num_processes)
 
-    synchronization['trigger_process_loop'] = multiprocessing.Event()
-    synchronization['trigger_process_loop'].set()
-    synchronization['process_finished'] = multiprocessing.Event()
-    synchronization['reap_process_loop'] = multiprocessing.Event()
-    synchronization['processes_lock'] = multiprocessing.Lock()
-    synchronization['running_pids'] = manager.dict()
-    synchronization['finished_pids'] = manager.dict()
-    synchronization['processes'] = dict()
+    for test in synchronization.pop('cached_tests', []):
+        report_cached_test(test)
 
-    proc_loop = multiprocessing.Process(target=process_loop, args=(num_processes,))
-    proc_loop.start()
+    from pytest_mp.shared import SharedFixtures
+    synchronization['shared_fixtures'] = SharedFixtures(session, batches)
 
-    run_batched_tests(batches, session, num_processes)
+    try:
+        run_batched_tests(batches, session, num_processes)
+    finally:
+        report_shared_teardown_errors(session, synchronization['shared_fixtures'].close())
+    synchronization['run_end'] = time.time()
 
-    synchronization['reap_process_loop'].set()
-    proc_loop.join()
+    stop_scheduler()
 
     if synchronization['stats']['failed']:
         session.testsfailed = True
@@ -366,6 +1084,43 @@ def pytest_runtestloop(session):
     return True
 
 
+def item_reruns(item):
+    marker = item.get_closest_marker('mp_group')
+    reruns = getattr(marker, 'kwargs', {}).get('reruns')
+    return reruns if reruns is not None else item.config.option.mp_reruns
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_protocol(item, nextitem):
+    reruns = item_reruns(item)
+    if not reruns:
+        return None
+
+    item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+    for attempt in range(reruns + 1):
+        reports = runtestprotocol(item, nextitem=nextitem, log=False)
+        if attempt == reruns or not any(rep.failed and not hasattr(rep, 'wasxfail') for rep in reports):
+            for rep in reports:
+                item.ihook.pytest_runtest_logreport(report=rep)
+            break
+        # Only the failures of earlier attempts are reported, as reruns.
+        for rep in reports:
+            if rep.failed:
+                rep.outcome = 'rerun'
+                rep.rerun = attempt + 1
+                item.ihook.pytest_runtest_logreport(report=rep)
+    item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+    return True
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_report_teststatus(report):
+    if report.outcome == 'rerun':
+        return 'rerun', 'R', ('RERUN', {'yellow': True})
+    if getattr(report, 'mp_cached', False) and report.when == 'call':
+        return 'cached', 'c', ('CACHED', {'green': True})
+
+
 def pytest_runtest_logreport(report):
     # Keep flag of failed tests for session.testsfailed, which decides return code.
     if 'stats' in synchronization:
@@ -375,25 +1130,97 @@ def pytest_runtest_logreport(report):
                     synchronization['stats']['failed'] = True
 
 
+def pytest_sessionfinish(session):
+    if synchronization.get('coverage_owner') == os.getpid():
+        synchronization['coverage'].finish()
+
+    # Record test durations of multiprocessed runs for --mp-plan.
+    terminalreporter = session.config.pluginmanager.get_plugin('terminalreporter')
+    if 'run_end' in synchronization and getattr(session.config, 'cache', None) and terminalreporter:
+        from pytest_mp.plan import record_durations
+        record_durations(session.config, terminalreporter.stats)
+        if 'result_cache' in synchronization:
+            synchronization['result_cache'].record(terminalreporter.stats)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if synchronization.get('coverage_owner') == os.getpid():
+        write_coverage(terminalreporter, synchronization['coverage'])
+
+    if not terminalreporter.config.option.mp_report or 'run_end' not in synchronization:
+        return
+
+    from pytest_mp.report import summarize, write_report
+    workers = synchronization['workers']
+    for pid, started in synchronization['worker_started'].items():
+        if pid in workers:
+            workers[pid]['started'] = started
+    summary = summarize(list(workers.values()), synchronization['barriers'], state_fixtures['num_processes'],
+                        synchronization['run_start'], synchronization['run_end'])
+    write_report(terminalreporter, summary)
+
+
+def write_coverage(terminalreporter, cov):
+    terminalreporter.write_sep('-', 'coverage')
+    terminalreporter.write_line('Combined {} worker data files into {}.'.format(cov.combined, cov.data_file))
+    output = py.io.TextIO()
+    try:
+        cov.cov.report(file=output)
+    except Exception as e:  # e.g. no data was collected
+        output.write('{}\n'.format(e))
+    terminalreporter.write(output.getvalue())
+
+
 @pytest.mark.trylast
 def pytest_configure(config):
     config.addinivalue_line('markers',
                             "mp_group('GroupName', strategy): test (suite) is in named "
                             "grouped w/ desired strategy: 'free' (default), 'serial', "
-                            "'isolated_free', or 'isolated_serial'.")
+                            "'isolated_free', 'isolated_serial', 'sharded_serial', 'async_free', or "
+                            "'threaded_free'.")
+
+    use_mp = mp_enabled(config)
+    if use_mp:
+        start_synchronization()
+    else:
+        start_local_synchronization()
+    manager = synchronization['manager']
 
+    # The stock reporter is fine within a single process, except for --instafail.
     standard_reporter = config.pluginmanager.get_plugin('terminalreporter')
-    if standard_reporter:
+    if standard_reporter and (use_mp or config.option.instafail):
         from pytest_mp.terminal import MPTerminalReporter
         mp_reporter = MPTerminalReporter(standard_reporter, manager)
         config.pluginmanager.unregister(standard_reporter)
         config.pluginmanager.register(mp_reporter, 'terminalreporter')
 
-    if config.option.use_mp is None:
-        if not config.getini('mp'):
-            return
+    board = config.option.mp_board or config.getini('mp_board') or 'manager'
+    if board not in board_backends:
+        raise ValueError('mp_board must be one of {}.'.format(', '.join(board_backends)))
+    if board == 'mmap' and use_mp:
+        from pytest_mp.board import MMapMessageBoard
+        synchronization['fixture_message_board'] = MMapMessageBoard.create()
+        synchronization['board_owner'] = os.getpid()
+    else:
+        synchronization['fixture_message_board'] = synchronization['manager_message_board']
 
-    if config.option.xmlpath is not None:
+    # Per-session temp directories, removed by this (the parent) process in pytest_unconfigure.
+    # With --mp they are created before any worker is forked, so that every worker shares them,
+    # otherwise only once mp_shared_buffer or mp_locks is used.
+    synchronization['session_owner'] = os.getpid()
+    if use_mp:
+        session_storage('shared_buffers')
+        session_storage('locks')
+
+    if config.option.mp_resources is not None:
+        from pytest_mp.resources import ResourceAccounting
+        config.pluginmanager.register(ResourceAccounting(config), 'mpresources')
+
+    if config.option.mp_fixture_profile is not None:
+        from pytest_mp.profiling import FixtureProfiler
+        config.pluginmanager.register(FixtureProfiler(config, manager.list()), 'mpfixtureprofile')
+
+    if use_mp and config.option.xmlpath is not None:
         from pytest_mp.junitxml import MPLogXML
         synchronization['node_reporters'] = manager.list()
         synchronization['node_reporters_lock'] = manager.Lock()
@@ -401,3 +1228,19 @@ def pytest_configure(config):
         config.pluginmanager.unregister(config._xml)
         config._xml = MPLogXML(xmlpath, config.option.junitprefix, config.getini("junit_suite_name"), manager)
         config.pluginmanager.register(config._xml, 'mpjunitxml')
+
+
+@pytest.mark.trylast
+def pytest_unconfigure(config):
+    if 'process_loop' in synchronization:  # e.g. collection was interrupted while streaming
+        stop_scheduler()
+    if synchronization.pop('session_owner', None) == os.getpid():
+        for name in ('shared_buffers', 'locks'):
+            if name in synchronization:
+                synchronization[name].cleanup()
+    if synchronization.pop('board_owner', None) == os.getpid():
+        synchronization['fixture_message_board'].unlink()
+    manager = synchronization.get('manager')
+    if hasattr(manager, 'shutdown'):
+        manager.shutdown()
+    synchronization.clear()
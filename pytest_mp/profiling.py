@@ -0,0 +1,113 @@
+import functools
+import threading
+import time
+
+import pytest
+
+
+# Fixture setup cost profiling for --mp-fixture-profile.
+# Each test process times fixture setup and teardown locally and appends what
+# it has recorded to a shared list after every test's teardown, and after
+# fixtures torn down outside of one (e.g. by a recycled worker), so the
+# timings of a worker that crashes or is recycled aren't lost.
+
+repeatable_scopes = ('session', 'package', 'module', 'class')
+
+
+class FixtureProfiler(object):
+
+    def __init__(self, config, shared_timings):
+        self.config = config
+        self.shared_timings = shared_timings
+        self.timings = dict()
+        self.teardown_started = dict()
+        self.lock = threading.Lock()  # Lanes record and flush from several threads.
+
+    def _record(self, fixturedef, count=0, setup=0.0, teardown=0.0):
+        key = (fixturedef.argname, fixturedef.scope, fixturedef.baseid)
+        with self.lock:
+            timing = self.timings.setdefault(key, [0, 0.0, 0.0])
+            timing[0] += count
+            timing[1] += setup
+            timing[2] += teardown
+
+    def _start_teardown(self, fixturedef):
+        self.teardown_started[fixturedef] = time.time()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        if getattr(fixturedef.func, '__name__', None) == 'get_direct_param_fixture_func':  # A parametrized argument
+            yield
+            return
+        start = time.time()
+        yield
+        self._record(fixturedef, count=1, setup=time.time() - start)
+        # Finalizers run last in, first out, so this marks the start of the fixture's own teardown.
+        fixturedef.addfinalizer(functools.partial(self._start_teardown, fixturedef))
+
+    def pytest_fixture_post_finalizer(self, fixturedef, request):
+        start = self.teardown_started.pop(fixturedef, None)
+        if start is not None:
+            self._record(fixturedef, teardown=time.time() - start)
+
+    def flush(self):
+        """Pass the timings recorded so far on to the parent"""
+        with self.lock:
+            timings, self.timings = self.timings, dict()
+        if timings:
+            self.shared_timings.append(timings)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_teardown(self, item, nextitem):
+        yield
+        self.flush()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        tr = terminalreporter
+        num_fixtures = self.config.option.mp_fixture_profile
+
+        self.flush()  # Anything finalized after the last test, i.e. in the parent
+
+        totals = dict()
+        for timings in self.shared_timings[:]:
+            for key, (count, setup, teardown) in timings.items():
+                total = totals.setdefault(key, [0, 0.0, 0.0])
+                total[0] += count
+                total[1] += setup
+                total[2] += teardown
+        if not totals:
+            return
+
+        if num_fixtures:
+            tr.write_sep('=', 'pytest-mp {} most expensive fixtures'.format(num_fixtures))
+        else:
+            tr.write_sep('=', 'pytest-mp most expensive fixtures')
+
+        ranked = sorted(totals.items(), key=lambda x: x[1][1] + x[1][2], reverse=True)
+        if num_fixtures:
+            ranked = ranked[:num_fixtures]
+
+        candidates = []
+        for (name, scope, baseid), (count, setup, teardown) in ranked:
+            location = ' [{}]'.format(baseid) if baseid else ''
+            tr.write_line('fixture {} ({}){} built {:,} {}, {} total ({} setup, {} teardown)'
+                          .format(name, scope, location, count, 'time' if count == 1 else 'times',
+                                  format_duration(setup + teardown),
+                                  format_duration(setup), format_duration(teardown)))
+            if scope in repeatable_scopes and count > 1:
+                candidates.append((name, scope, (setup + teardown) * (count - 1) / count))
+
+        for name, scope, repeated in candidates:
+            tr.write_line('{} fixture {} is rebuilt per worker process; sharing it via mp_trail or moving its '
+                          'tests to a serial group could save up to {}'.format(scope, name,
+                                                                               format_duration(repeated)))
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return '{:.2f}s'.format(seconds)
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return '{:d}m {:.1f}s'.format(int(minutes), seconds)
+    hours, minutes = divmod(minutes, 60)
+    return '{:d}h {:d}m'.format(int(hours), int(minutes))
@@ -0,0 +1,116 @@
+import collections
+
+
+# Scheduler efficiency summary for --mp-report.
+# Built entirely from the spawn/finish/reap timestamps and isolation barriers
+# the scheduler records in the parent process.
+
+
+def _overlap(start, end, window_start, window_end):
+    return max(0.0, min(end, window_end) - max(start, window_start))
+
+
+def _lower_bound(units, num_processes):
+    """Best possible makespan for independent units on num_processes slots"""
+    if not units:
+        return 0.0
+    return max(sum(units) / float(num_processes), max(units))
+
+
+def ideal_makespan(workers, num_processes):
+    """Makespan of an ideal scheduler given the same work and --np.
+
+    Non-isolated work may be packed freely, while each isolated group still
+    needs the machine to itself.
+    """
+    shared = []
+    isolated = collections.OrderedDict()
+    for worker in workers:
+        duration = worker['finished'] - worker['spawned']
+        if worker['strategy'].startswith('isolated_'):
+            isolated.setdefault(worker['group'], []).append(duration)
+        else:
+            shared.append(duration)
+
+    makespan = _lower_bound(shared, num_processes)
+    for units in isolated.values():
+        makespan += _lower_bound(units, num_processes)
+    return makespan
+
+
+def summarize(workers, barriers, num_processes, start, end):
+    workers = [w for w in workers if 'finished' in w]
+    wall = end - start
+    slot_time = num_processes * wall
+    busy = sum(w['finished'] - w['spawned'] for w in workers)
+
+    barrier_idle = []
+    for barrier in barriers:
+        in_use = sum(_overlap(w['spawned'], w['finished'], barrier['start'], barrier['end']) for w in workers)
+        idle = num_processes * (barrier['end'] - barrier['start']) - in_use
+        barrier_idle.append((barrier['group'], barrier['when'], max(0.0, idle)))
+
+    spawn_latencies = [w['started'] - w['spawned'] for w in workers if 'started' in w]
+    reap_latencies = [w['reaped'] - w['finished'] for w in workers if 'reaped' in w]
+
+    groups = collections.OrderedDict()
+    for worker in workers:
+        span = groups.setdefault(worker['group'], dict(strategy=worker['strategy'], start=worker['spawned'],
+                                                       end=worker['finished']))
+        span['start'] = min(span['start'], worker['spawned'])
+        span['end'] = max(span['end'], worker['finished'])
+
+    longest = None
+    if groups:
+        name = max(groups, key=lambda x: groups[x]['end'] - groups[x]['start'])
+        longest = (name, groups[name]['strategy'], groups[name]['end'] - groups[name]['start'])
+
+    return dict(num_processes=num_processes,
+                num_workers=len(workers),
+                wall=wall,
+                slot_time=slot_time,
+                busy=busy,
+                barrier_idle=barrier_idle,
+                spawn_latency=sum(spawn_latencies) / len(spawn_latencies) if spawn_latencies else None,
+                reap_latency=sum(reap_latencies) / len(reap_latencies) if reap_latencies else None,
+                longest_group=longest,
+                recycled=collections.Counter(w['recycled'] for w in workers if 'recycled' in w),
+                crashed=collections.Counter(w['crashed'] for w in workers if 'crashed' in w),
+                prewarmed=len([w for w in workers if 'prewarmed' in w]),
+                ideal_makespan=ideal_makespan(workers, num_processes))
+
+
+def write_report(terminalreporter, summary):
+    tr = terminalreporter
+    tr.write_sep('=', 'pytest-mp scheduler report')
+    if not summary['num_workers']:
+        tr.write_line('no worker processes were run')
+        return
+
+    utilization = 100.0 * summary['busy'] / summary['slot_time'] if summary['slot_time'] else 0.0
+    tr.write_line('worker slots: {} x {:.2f}s = {:.2f}s, busy {:.2f}s ({:.1f}%) over {} workers'
+                  .format(summary['num_processes'], summary['wall'], summary['slot_time'], summary['busy'],
+                          utilization, summary['num_workers']))
+
+    for group, when, idle in summary['barrier_idle']:
+        tr.write_line('isolation barrier {} {}: {:.2f}s idle slot time'.format(when, group, idle))
+
+    if summary['spawn_latency'] is not None:
+        tr.write_line('spawn to first test: {:.3f}s average'.format(summary['spawn_latency']))
+    if summary['reap_latency'] is not None:
+        tr.write_line('reaping latency: {:.3f}s average'.format(summary['reap_latency']))
+
+    for kind in ('recycled', 'crashed'):
+        if summary[kind]:
+            tr.write_line('{} workers: {} ({})'.format(
+                kind, sum(summary[kind].values()),
+                ', '.join('{}: {}'.format(reason, count) for reason, count in sorted(summary[kind].items()))))
+
+    if summary['prewarmed']:
+        tr.write_line('prewarmed workers: {} (started before their isolation barrier)'.format(summary['prewarmed']))
+
+    if summary['longest_group']:
+        tr.write_line('longest group (critical path): {} ({}) {:.2f}s'.format(*summary['longest_group']))
+
+    tr.write_line('ideal makespan with --np {}: {:.2f}s (actual {:.2f}s)'
+                  .format(summary['num_processes'], summary['ideal_makespan'], summary['wall']))
@@ -0,0 +1,126 @@
+import os
+
+import psutil
+import pytest
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+# Per-test resource accounting for --mp-resources.
+# Usage is measured from the start of setup to the end of teardown in the process
+# running the test, so `free` tests are accounted for exactly.  Peak RSS is the
+# high-water mark of the whole process (inherited from the parent by forked
+# workers, and kept from earlier tests by serial ones), so a test is charged with
+# how much it raised the mark, and with the mark itself only if it raised it.
+
+
+def _peak_rss(process):
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+        return maxrss if psutil.MACOS else maxrss * 1024
+    return process.memory_info().rss
+
+
+def snapshot(process):
+    cpu = process.cpu_times()
+    usage = dict(cpu_user=cpu.user, cpu_system=cpu.system, peak_rss=_peak_rss(process))
+    try:
+        io = process.io_counters()
+    except (AttributeError, psutil.Error):  # Not supported on macOS
+        pass
+    else:
+        usage.update(read_bytes=io.read_bytes, write_bytes=io.write_bytes)
+    return usage
+
+
+def usage_since(start, end):
+    usage = dict(peak_rss_growth=max(0, end['peak_rss'] - start['peak_rss']))
+    if usage['peak_rss_growth']:
+        usage['peak_rss'] = end['peak_rss']
+    for key in ('cpu_user', 'cpu_system', 'read_bytes', 'write_bytes'):
+        if key in start and key in end:
+            usage[key] = end[key] - start[key]
+    usage['cpu_user'] = round(usage['cpu_user'], 3)
+    usage['cpu_system'] = round(usage['cpu_system'], 3)
+    return usage
+
+
+class ResourceAccounting(object):
+
+    def __init__(self, config):
+        self.config = config
+        self._process = None
+
+    @property
+    def process(self):
+        # Children are forked from the parent, so refresh the handle per pid.
+        if self._process is None or self._process.pid != os.getpid():
+            self._process = psutil.Process()
+        return self._process
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_setup(self, item):
+        item._mp_resources_start = snapshot(self.process)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        usage = None
+        start = getattr(item, '_mp_resources_start', None)
+        if call.when == 'teardown' and start is not None:
+            usage = usage_since(start, snapshot(self.process))
+            for key in sorted(usage):
+                item.user_properties.append(('mp_' + key, usage[key]))
+            del item._mp_resources_start
+
+        outcome = yield
+        if usage is not None:
+            outcome.get_result().mp_resources = usage
+
+    def pytest_terminal_summary(self, terminalreporter):
+        tr = terminalreporter
+        num_tests = self.config.option.mp_resources
+
+        accounted = []
+        for reports in tr.stats.values():
+            for rep in reports[:]:
+                if hasattr(rep, 'mp_resources'):
+                    accounted.append(rep)
+        if not accounted:
+            return
+
+        if num_tests:
+            tr.write_sep('=', 'pytest-mp {} most expensive tests'.format(num_tests))
+        else:
+            tr.write_sep('=', 'pytest-mp most expensive tests')
+
+        by_cpu = sorted(accounted, key=lambda x: x.mp_resources['cpu_user'] + x.mp_resources['cpu_system'],
+                        reverse=True)
+        by_rss = sorted(accounted, key=lambda x: x.mp_resources['peak_rss_growth'], reverse=True)
+        if num_tests:
+            by_cpu = by_cpu[:num_tests]
+            by_rss = by_rss[:num_tests]
+
+        tr.write_line('by CPU time (user/system):')
+        for rep in by_cpu:
+            usage = rep.mp_resources
+            tr.write_line('{:8.2f}s {:8.2f}s  {}'.format(usage['cpu_user'], usage['cpu_system'], rep.nodeid))
+
+        tr.write_line('by peak RSS growth (read/write bytes):')
+        for rep in by_rss:
+            usage = rep.mp_resources
+            read_bytes = format_bytes(usage['read_bytes']) if 'read_bytes' in usage else '-'
+            write_bytes = format_bytes(usage['write_bytes']) if 'write_bytes' in usage else '-'
+            tr.write_line('{:>9} {:>9} {:>9}  {}'.format(format_bytes(usage['peak_rss_growth']), read_bytes,
+                                                          write_bytes, rep.nodeid))
+
+
+def format_bytes(num):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(num) < 1024:
+            return '{:.1f}{}'.format(num, unit) if unit != 'B' else '{}B'.format(num)
+        num /= 1024.0
+    return '{:.1f}GiB'.format(num)
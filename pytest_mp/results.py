@@ -0,0 +1,175 @@
+import ast
+import hashlib
+import os
+import platform
+import sys
+import time
+
+
+# Result cache for --mp-cache.
+# A test that passed is recorded under a key hashing its node id, the test
+# module, the local modules it imports (transitively), the conftest files above
+# it and the environment (python version, ini file and the variables listed in
+# the mp_cache_env ini value).  As long as none of these change, the test is
+# not run again.
+
+results_key = 'mp/results'
+default_cache_size = 100000
+
+
+class ResultCache(object):
+
+    def __init__(self, config):
+        self.config = config
+        self.rootdir = str(config.rootdir)
+        self.max_entries = config.option.mp_cache_size or default_cache_size
+        self.entries = {} if config.option.mp_cache_clear else config.cache.get(results_key, {})
+        self.keys = dict()
+        self._digests = dict()
+        self._dependencies = dict()
+        self._environment = self._hash_environment()
+
+    def _hash_environment(self):
+        digest = hashlib.sha1(platform.python_version().encode('utf-8'))
+        inifile = getattr(self.config, 'inifile', None)
+        if inifile:
+            digest.update(self._digest(str(inifile)).encode('utf-8'))
+        for name in self.config.getini('mp_cache_env'):
+            digest.update('{}={}\n'.format(name, os.environ.get(name)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _digest(self, path):
+        if path not in self._digests:
+            try:
+                with open(path, 'rb') as f:
+                    self._digests[path] = hashlib.sha1(f.read()).hexdigest()
+            except (IOError, OSError):
+                self._digests[path] = None
+        return self._digests[path]
+
+    def _is_local(self, path):
+        path = os.path.abspath(path)
+        return path.startswith(self.rootdir + os.sep) and 'site-packages' not in path.split(os.sep)
+
+    def _imported_names(self, path, package):
+        """Names of the modules imported by the source at path, relative imports resolved"""
+        try:
+            with open(path, 'rb') as f:
+                tree = ast.parse(f.read(), path)
+        except (IOError, OSError, SyntaxError, ValueError):
+            return []
+
+        names = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ''
+                if node.level:
+                    parts = (package or '').split('.')
+                    parts = parts[:len(parts) - node.level + 1]
+                    base = '.'.join([x for x in parts if x] + ([node.module] if node.module else []))
+                if base:
+                    names.append(base)
+                # `from package import module` imports a submodule
+                names.extend('{}.{}'.format(base, alias.name) if base else alias.name for alias in node.names)
+        return names
+
+    def _local_modules(self, path, package):
+        if path not in self._dependencies:
+            modules = []
+            for name in self._imported_names(path, package):
+                module = sys.modules.get(name)
+                module_path = getattr(module, '__file__', None)
+                if not module_path:
+                    continue
+                if module_path.endswith(('.pyc', '.pyo')):
+                    module_path = module_path[:-1]
+                if self._is_local(module_path):
+                    modules.append((os.path.abspath(module_path), getattr(module, '__package__', None)))
+            self._dependencies[path] = modules
+        return self._dependencies[path]
+
+    def dependencies(self, path, package):
+        """The source at path and the local modules it imports, transitively"""
+        seen = set()
+        pending = [(os.path.abspath(path), package)]
+        while pending:
+            path, package = pending.pop()
+            if path in seen:
+                continue
+            seen.add(path)
+            pending.extend(self._local_modules(path, package))
+        return seen
+
+    def conftests(self, path):
+        files = []
+        directory = os.path.dirname(os.path.abspath(path))
+        while self._is_local(directory) or directory == self.rootdir:
+            conftest = os.path.join(directory, 'conftest.py')
+            if os.path.exists(conftest):
+                files.append(conftest)
+            if directory == self.rootdir:
+                break
+            directory = os.path.dirname(directory)
+        return files
+
+    def key(self, item):
+        if item.nodeid not in self.keys:
+            module = getattr(item, 'module', None)
+            package = getattr(module, '__package__', None)
+            files = self.dependencies(str(item.fspath), package) | set(self.conftests(str(item.fspath)))
+            digest = hashlib.sha1('{}\n{}\n'.format(item.nodeid, self._environment).encode('utf-8'))
+            for path in sorted(files):
+                digest.update('{} {}\n'.format(path, self._digest(path)).encode('utf-8'))
+            self.keys[item.nodeid] = digest.hexdigest()
+        return self.keys[item.nodeid]
+
+    def passed(self, item):
+        return self.key(item) in self.entries
+
+    def record(self, stats):
+        """Record the tests that passed (without reruns) in this run, then drop the oldest entries over the limit"""
+        passed = set()
+        failed = set()
+        for category, reports in stats.items():
+            for rep in reports[:]:
+                nodeid = getattr(rep, 'nodeid', None)
+                if nodeid not in self.keys or getattr(rep, 'when', None) not in ('setup', 'call', 'teardown'):
+                    continue
+                if category == 'passed' and rep.when == 'call':
+                    passed.add(nodeid)
+                elif category in ('failed', 'error', 'rerun'):
+                    failed.add(nodeid)
+
+        now = time.time()
+        for nodeid in passed - failed:
+            self.entries[self.keys[nodeid]] = now
+        if len(self.entries) > self.max_entries:
+            newest = sorted(self.entries, key=self.entries.get, reverse=True)[:self.max_entries]
+            self.entries = dict((key, self.entries[key]) for key in newest)
+        self.config.cache.set(results_key, self.entries)
+
+
+def skip_cached(result_cache, batches):
+    """Remove cached tests from batches and return them.
+
+    Tests of free groups are skipped one by one, other groups only when every
+    one of their tests is cached.
+    """
+    cached = []
+    for name in list(batches):
+        tests = batches[name]['tests']
+        hits = [test for test in tests if result_cache.passed(test)]
+        if len(hits) == len(tests):
+            del batches[name]
+        elif hits and batches[name]['strategy'].endswith('free'):
+            batches[name]['tests'] = [test for test in tests if not result_cache.passed(test)]
+        else:
+            continue
+        cached.extend(hits)
+
+    now = time.time()
+    for test in cached:
+        result_cache.entries[result_cache.key(test)] = now
+    return cached
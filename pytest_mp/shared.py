@@ -0,0 +1,178 @@
+import collections
+import inspect
+
+from _pytest.compat import getfuncargnames
+from _pytest.outcomes import TEST_OUTCOME
+import pytest
+
+
+# Session fixtures evaluated once by the coordinator (the pytest-mp parent process).
+# Values are set up right before the first group using them is dispatched, so
+# every worker forked afterwards inherits them, and are torn down once the
+# last group using them has been reaped.
+
+# fixture function -> value (or error, or skip message) of its coordinated setup, inherited by workers
+coordinated_values = dict()
+coordinated_errors = dict()
+coordinated_skips = dict()
+
+
+def mp_shared_fixture(function=None, name=None):
+    """Decorator for a session fixture that pytest-mp sets up once in the coordinator.
+
+    Dependencies of a shared fixture must themselves be shared fixtures.  Without
+    --mp it behaves like any other session fixture.
+    """
+    def decorator(function):
+
+        def shared_fixture(request):
+            if function in coordinated_errors:
+                raise Exception('mp_shared_fixture {} setup failed in the coordinator: {}'
+                                .format(request.fixturename, coordinated_errors[function]))
+            if function in coordinated_skips:
+                pytest.skip(coordinated_skips[function])
+            if function in coordinated_values:
+                return coordinated_values[function]
+
+            value, finalizer = call_fixture(function, request.getfixturevalue)
+            if finalizer:
+                request.addfinalizer(finalizer)
+            return value
+
+        shared_fixture.mp_shared = function
+        return pytest.fixture(scope='session', name=name or function.__name__)(shared_fixture)
+
+    if function is not None:
+        return decorator(function)
+    return decorator
+
+
+def call_fixture(function, getfixturevalue):
+    """Return the value of a fixture function and its teardown, if any"""
+    kwargs = dict((argname, getfixturevalue(argname)) for argname in getfuncargnames(function))
+    if not inspect.isgeneratorfunction(function):
+        return function(**kwargs), None
+
+    generator = function(**kwargs)
+    value = next(generator)
+
+    def finalizer():
+        try:
+            next(generator)
+        except StopIteration:
+            return
+        raise Exception('mp_shared_fixture {} yielded more than once'.format(function.__name__))
+
+    return value, finalizer
+
+
+def shared_function(session, argname, nodeid):
+    fixturedefs = session._fixturemanager.getfixturedefs(argname, nodeid)
+    if not fixturedefs:
+        return None
+    return getattr(fixturedefs[-1].func, 'mp_shared', None)
+
+
+class SharedFixtures(object):
+    """Coordinator side bookkeeping of the shared fixtures used by each group"""
+
+    def __init__(self, session, batches):
+        self.session = session
+        self.needed = dict()  # group -> {fixture function: nodeid of its first consumer}
+        self.consumers = dict()  # fixture function -> set of groups
+        self.remaining = dict()  # group -> processes not yet reaped
+        self.dispatched = set()
+        self.setup_order = []
+        self.finalizers = dict()
+        self.teardown_errors = []
+
+        for group, batch in batches.items():
+            for test in batch['tests']:
+                for argname in test.fixturenames:
+                    function = shared_function(session, argname, test.nodeid)
+                    needed = self.needed.setdefault(group, collections.OrderedDict())
+                    if function is None or function in needed:
+                        continue
+                    needed[function] = test.nodeid
+                    for dependency in self._closure(function, test.nodeid):
+                        self.consumers.setdefault(dependency, set()).add(group)
+
+    def _closure(self, function, nodeid, seen=None):
+        seen = seen if seen is not None else []
+        if function not in seen:
+            seen.append(function)
+            for argname in getfuncargnames(function):
+                dependency = shared_function(self.session, argname, nodeid)
+                if dependency is not None:
+                    self._closure(dependency, nodeid, seen)
+        return seen
+
+    def _setup(self, function, nodeid):
+        if function in coordinated_values:
+            return coordinated_values[function]
+
+        def getfixturevalue(argname):
+            dependency = shared_function(self.session, argname, nodeid)
+            if dependency is None:
+                raise Exception('mp_shared_fixture {} depends on {}, which is not an mp_shared_fixture.'
+                                .format(function.__name__, argname))
+            return self._setup(dependency, nodeid)
+
+        value, finalizer = call_fixture(function, getfixturevalue)
+        coordinated_values[function] = value
+        self.setup_order.append(function)
+        if finalizer:
+            self.finalizers[function] = finalizer
+        return value
+
+    def dispatch(self, group, processes):
+        """Set up the shared fixtures of a group before its first process is started"""
+        self.dispatched.add(group)
+        self.remaining[group] = self.remaining.get(group, 0) + processes
+        for function, nodeid in self.needed.get(group, {}).items():
+            if function in coordinated_values or function in coordinated_errors or function in coordinated_skips:
+                continue
+            try:
+                self._setup(function, nodeid)
+            except pytest.skip.Exception as e:
+                coordinated_skips[function] = e.msg
+            except TEST_OUTCOME as e:
+                coordinated_errors[function] = '{}: {}'.format(type(e).__name__, e)
+
+    def respawned(self, group):
+        """Account for another process of a group, e.g. one replacing a recycled worker"""
+        self.remaining[group] = self.remaining.get(group, 0) + 1
+
+    def reaped(self, group):
+        # Workers can be reaped before their group is dispatched, e.g. discarded prewarmed ones.
+        self.remaining[group] = self.remaining.get(group, 0) - 1
+        if self.remaining[group] or group not in self.dispatched:
+            return
+        del self.remaining[group]
+
+        finished = []
+        for function, groups in self.consumers.items():
+            groups.discard(group)
+            if not groups:
+                finished.append(function)
+        self._teardown(finished)
+
+    def _teardown(self, functions):
+        for function in reversed(self.setup_order[:]):
+            if function not in functions:
+                continue
+            self.setup_order.remove(function)
+            del coordinated_values[function]
+            finalizer = self.finalizers.pop(function, None)
+            if finalizer:
+                try:
+                    finalizer()
+                except Exception as e:
+                    self.teardown_errors.append('{} ({}: {})'.format(function.__name__, type(e).__name__, e))
+
+    def close(self):
+        """Tear down anything left over and return the errors of every failed teardown"""
+        self._teardown(list(self.setup_order))
+        coordinated_errors.clear()
+        coordinated_skips.clear()
+        return self.teardown_errors
@@ -0,0 +1,291 @@
+import glob
+import multiprocessing
+import os
+import sys
+import threading
+
+import pytest
+
+from pytest_mp.board import ManagerMessageBoard, MMapMessageBoard
+
+
+backends = ('manager', 'mmap')
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_board_mapping_api(testdir, backend):
+    testdir.makepyfile("""
+        def test_one(mp_message_board):
+            mp_message_board['one'] = 1
+            mp_message_board[('tuple', 'key')] = dict(nested=[1, 2])
+            assert mp_message_board['one'] == 1
+            assert mp_message_board[('tuple', 'key')] == dict(nested=[1, 2])
+            assert 'one' in mp_message_board
+            assert mp_message_board.get('missing', 'default') == 'default'
+            mp_message_board['one'] += 1
+            assert mp_message_board['one'] == 2
+            del mp_message_board['one']
+            assert 'one' not in mp_message_board
+            assert ('tuple', 'key') in mp_message_board.keys()
+
+    """)
+
+    result = testdir.runpytest('--mp', '--mp-board={}'.format(backend))
+    result.assert_outcomes(passed=1)
+    assert result.ret == 0
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_board_shared_between_workers(testdir, backend):
+    testdir.makepyfile("""
+        from time import sleep
+
+        import pytest
+
+        @pytest.mark.parametrize('val', range(20))
+        def test_publish(val, mp_message_board):
+            mp_message_board['board_shared_{}'.format(val)] = 'x' * 10000 * val
+
+        @pytest.mark.parametrize('val', range(20))
+        def test_read(val, mp_message_board):
+            for _ in range(40):
+                if 'board_shared_{}'.format(val) in mp_message_board:
+                    assert mp_message_board['board_shared_{}'.format(val)] == 'x' * 10000 * val
+                    return
+                sleep(.25)
+            assert False
+
+    """)
+
+    result = testdir.runpytest('--mp', '--mp-board={}'.format(backend))
+    result.assert_outcomes(passed=40)
+    assert result.ret == 0
+
+
+def test_mmap_board_from_ini_with_trail(testdir):
+    testdir.makeini("""
+        [pytest]
+        mp_board = mmap
+    """)
+    testdir.makepyfile("""
+        import pytest
+
+        from pytest_mp.board import MMapMessageBoard
+
+        @pytest.mark.parametrize('val', range(50))
+        def test_mp_trail(val, mp_trail, mp_message_board):
+            assert isinstance(mp_message_board, MMapMessageBoard)
+            with mp_trail('mmap_single_start') as start:
+                if start:
+                    if 'one_start' not in mp_message_board:
+                        mp_message_board['one_start'] = 0
+                    mp_message_board['one_start'] += 1
+
+            assert mp_message_board['one_start'] == 1
+
+    """)
+
+    before = set(glob.glob(os.path.join('/dev/shm', 'pytest-mp-board-*')))
+    result = testdir.runpytest('--mp')
+    result.assert_outcomes(passed=50)
+    assert result.ret == 0
+    assert set(glob.glob(os.path.join('/dev/shm', 'pytest-mp-board-*'))) == before
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_board_wait_for_and_subscribe(testdir, backend):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        KEY = 'wait_for_{}'.format('%s')
+
+        def test_wait_for(mp_message_board):
+            with pytest.raises(KeyError):
+                mp_message_board.wait_for(KEY + '_never', timeout=.1)
+            assert mp_message_board.wait_for(KEY, timeout=30) == 'published'
+
+        def test_subscribe(mp_message_board):
+            subscription = mp_message_board.subscribe(KEY + '_changes')
+            mp_message_board[KEY + '_subscribed'] = True
+            assert subscription.get(timeout=30) == (KEY + '_changes', 1)
+            mp_message_board[KEY + '_received'] = True
+            assert subscription.get(timeout=30) == (KEY + '_changes', 2)
+            with pytest.raises(KeyError):
+                subscription.get(timeout=.1)
+
+        def test_publish(mp_message_board):
+            time.sleep(.5)
+            version = mp_message_board.version(KEY)
+            mp_message_board[KEY] = 'published'
+            assert mp_message_board.version(KEY) > version
+            mp_message_board.wait_for(KEY + '_subscribed', timeout=30)
+            mp_message_board[KEY + '_changes'] = 1
+            mp_message_board.wait_for(KEY + '_received', timeout=30)
+            mp_message_board[KEY + '_changes'] = 2
+
+    """ % backend)
+
+    result = testdir.runpytest('--mp', '--np', '3', '--mp-board={}'.format(backend))
+    result.assert_outcomes(passed=3)
+    assert result.ret == 0
+
+
+def test_cached_board_revalidates_through_change_counters():
+    manager = multiprocessing.Manager()
+    try:
+        board = ManagerMessageBoard(manager.dict())
+        board['host'] = 'first'
+        cached = board.cached()
+
+        reads = []
+        data = board._data
+
+        class CountingDict(object):
+            def get(self, key):
+                reads.append(key)
+                return data.get(key)
+
+        board._data = CountingDict()
+        assert cached['host'] == 'first'
+        assert cached['host'] == 'first'
+        assert cached.get('missing') is None and 'missing' not in cached
+        assert reads == ['host', 'missing']
+        board._data = data
+
+        writer = multiprocessing.Process(target=board.__setitem__, args=('host', 'second'))
+        writer.start()
+        writer.join()
+        assert cached['host'] == 'second'
+
+        cached['host'] = 'third'
+        assert board['host'] == 'third' and cached['host'] == 'third'
+        del cached['host']
+        assert 'host' not in cached
+    finally:
+        manager.shutdown()
+
+
+def test_mmap_board_written_from_threads():
+    board = MMapMessageBoard.create(size=4096)  # Small enough to compact and grow while the threads write.
+    try:
+        errors = []
+
+        def write(thread):
+            try:
+                for i in range(200):
+                    board['{}-{}'.format(thread, i % 20)] = (thread, i)
+                    assert board['{}-{}'.format(thread, i % 20)] == (thread, i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(x,)) for x in range(8)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert not errors
+        assert board.copy() == dict(('{}-{}'.format(t, i), (t, 180 + i)) for t in range(8) for i in range(20))
+    finally:
+        board.unlink()
+
+
+def test_cached_read_during_a_write_is_revalidated():
+    cached_reads = []
+
+    class InterleavedDict(dict):
+        """Reads the key through the cached view just before each write lands"""
+
+        def __setitem__(self, key, value):
+            cached_reads.append(cached.get(key))
+            dict.__setitem__(self, key, value)
+
+    board = ManagerMessageBoard(InterleavedDict())
+    cached = board.cached()
+    board['host'] = 'h1'
+    board['host'] = 'h2'
+    assert cached_reads == [None, 'h1']
+    assert 'host' in cached and cached['host'] == 'h2'
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_board_compound_operations_are_atomic(backend):
+    manager = multiprocessing.Manager()
+    board = ManagerMessageBoard(manager.dict()) if backend == 'manager' else MMapMessageBoard.create()
+    try:
+        owners = manager.list()
+        start = multiprocessing.Event()
+
+        def claim(i):
+            start.wait()
+            owners.append(board.setdefault('owner', i))
+            for task in range(50):
+                owners.append((task, board.setdefault(('task', task), i)))
+
+        workers = [multiprocessing.Process(target=claim, args=(i,)) for i in range(8)]
+        for worker in workers:
+            worker.start()
+        start.set()
+        for worker in workers:
+            worker.join()
+        assert len(set(owner for owner in owners if not isinstance(owner, tuple))) == 1
+        assert len(set(owner for owner in owners if isinstance(owner, tuple))) == 50
+        for task in range(50):
+            board.pop(('task', task))
+        assert board['owner'] == owners[0]
+
+        board.update(dict(a=1), b=2)
+        assert board.copy() == dict(owner=owners[0], a=1, b=2)
+        assert board.version('a') and board.version('a') != board.version('b')
+        key, value = board.popitem()
+        assert key not in board and len(board) == 2
+        assert board.pop(next(iter(board.keys()))) is not None and len(board) == 1
+        assert board.pop('missing', 'default') == 'default'
+        with pytest.raises(KeyError):
+            board.pop('missing')
+    finally:
+        if backend == 'mmap':
+            board.unlink()
+        manager.shutdown()
+
+
+def test_board_wait_runs_predicate_without_the_lock():
+    changed = threading.Condition(threading.Lock())
+    locked = []
+
+    class ProbedDict(dict):
+        def __contains__(self, key):
+            free = changed.acquire(False)
+            if free:
+                changed.release()
+            locked.append(not free)
+            return dict.__contains__(self, key)
+
+    board = ManagerMessageBoard(ProbedDict(), changed)
+    threading.Timer(.2, board.__setitem__, ('key', 'value')).start()
+    assert board.wait_for('key', timeout=5) == 'value'
+    assert locked and not any(locked)
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_cached_board_in_workers(testdir, backend):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('val', range(4))
+        def test_cached(val, mp_message_board):
+            board = mp_message_board.cached()
+            board.setdefault('cached_{}'.format('%s'), 'hostname')
+            for _ in range(100):
+                assert board['cached_{}'.format('%s')] == 'hostname'
+
+    """ % (backend, backend))
+
+    result = testdir.runpytest('--mp', '--mp-board={}'.format(backend))
+    result.assert_outcomes(passed=4)
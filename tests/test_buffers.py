@@ -0,0 +1,70 @@
+import os
+import stat
+
+import pytest
+
+from pytest_mp.buffers import SharedBuffers
+
+
+@pytest.mark.parametrize('use_mp', (True, False))
+def test_mp_shared_buffer_published_once_and_read_only(testdir, use_mp):
+    testdir.makepyfile("""
+        import array
+
+        import pytest
+
+        @pytest.fixture(scope='session')
+        def dataset(mp_trail, mp_shared_buffer):
+            with mp_trail('dataset') as start:
+                if start:
+                    mp_shared_buffer.publish('dataset', array.array('B', range(256)) * 4096)
+            with open('buffers.txt', 'a') as f:
+                f.write(mp_shared_buffer.directory + '\\n')
+            yield mp_shared_buffer['dataset']
+            with mp_trail('dataset', 'finish'):
+                pass
+
+        @pytest.mark.parametrize('val', range(4))
+        def test_read(val, dataset, mp_shared_buffer):
+            assert len(dataset) == 256 * 4096
+            assert dataset[255] == 255
+            assert dataset.readonly
+            with pytest.raises(TypeError):
+                dataset[0] = 1
+            assert 'dataset' in mp_shared_buffer
+            assert 'missing' not in mp_shared_buffer
+            assert mp_shared_buffer.get('missing') is None
+
+    """)
+
+    result = testdir.runpytest('--mp' if use_mp else '')
+    result.assert_outcomes(passed=4)
+    directories = set(testdir.tmpdir.join('buffers.txt').read().split())
+    assert len(directories) == 1
+    assert not any(os.path.exists(x) for x in directories)
+
+
+def test_mp_shared_buffer_republish_and_empty(testdir):
+    testdir.makepyfile("""
+        def test_publish(mp_shared_buffer):
+            assert bytes(mp_shared_buffer.publish('value', b'first')) == b'first'
+            assert bytes(mp_shared_buffer.publish('value', bytearray(b'second'))) == b'second'
+            assert bytes(mp_shared_buffer['value']) == b'second'
+            assert bytes(mp_shared_buffer.publish('empty', b'')) == b''
+
+    """)
+
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=1)
+
+
+def test_shared_buffers_session_directory_is_private():
+    first, second = SharedBuffers.for_session(), SharedBuffers.for_session()
+    try:
+        assert first.directory != second.directory
+        assert stat.S_IMODE(os.stat(first.directory).st_mode) == 0o700
+        first.publish('value', b'first')
+        assert 'value' not in second
+    finally:
+        first.cleanup()
+        second.cleanup()
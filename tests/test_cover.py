@@ -0,0 +1,35 @@
+import pytest
+
+
+def test_cov_bounds_data_files_by_workers(testdir):
+    coverage = pytest.importorskip('coverage')
+    testdir.makepyfile(measured="""
+        def branch(x):
+            if x:
+                return 1
+            return 2
+    """, test_measured="""
+        import pytest
+
+        import measured
+
+        @pytest.mark.parametrize('x', range(10))
+        def test_free(x):
+            assert measured.branch(x % 2)
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        def test_serial():
+            assert measured.branch(0) == 2
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-cov=measured')
+    result.assert_outcomes(passed=11)
+    result.stdout.fnmatch_lines(['Combined ? worker data files into *.coverage.', 'measured.py * 100%'])
+    combined = int(result.stdout.str().split('Combined ')[1].split()[0])
+    assert 1 <= combined <= 2
+
+    # Only the combined data file is left.
+    assert [x.basename for x in testdir.tmpdir.listdir('.coverage*')] == ['.coverage']
+    data = coverage.CoverageData(basename=str(testdir.tmpdir.join('.coverage')))
+    data.read()
+    assert sorted(data.lines(str(testdir.tmpdir.join('measured.py')))) == [1, 2, 3, 4]
@@ -0,0 +1,119 @@
+import os
+import socket
+import stat
+import subprocess
+import sys
+import time
+
+import psutil
+import pytest
+
+from pytest_mp import daemon
+
+
+def test_daemon_runs_invocations_in_forks(testdir):
+    testdir.makepyfile(helper="""
+        value = 1
+    """, test_daemon_run="""
+        import os
+
+        import helper
+
+        def test_value():
+            with open('ppid', 'w') as f:
+                f.write(str(os.getppid()))
+            assert helper.value == 1
+    """)
+
+    # No daemon yet, so the tests run in this process as usual.
+    result = testdir.runpytest_subprocess('--mp-daemon', '-p', 'no:cacheprovider')
+    result.assert_outcomes(passed=1)
+
+    path = daemon.socket_path(str(testdir.tmpdir))
+    proc = subprocess.Popen([sys.executable, '-m', 'pytest_mp.daemon', '--preload', 'helper'], cwd=str(testdir.tmpdir))
+    try:
+        deadline = time.time() + 30
+        while not os.path.exists(path) and time.time() < deadline:
+            time.sleep(.1)
+
+        result = testdir.runpytest_subprocess('--mp-daemon', '-p', 'no:cacheprovider')
+        result.assert_outcomes(passed=1)
+        assert int(testdir.tmpdir.join('ppid').read()) == proc.pid
+
+        # The daemon restarts when a preloaded module changes.
+        time.sleep(1)  # mtime resolution
+        testdir.makepyfile(helper="""
+            value = 2
+        """)
+        result = testdir.runpytest_subprocess('--mp-daemon', '-p', 'no:cacheprovider')
+        result.assert_outcomes(failed=1)
+        assert int(testdir.tmpdir.join('ppid').read()) == proc.pid
+    finally:
+        proc.terminate()
+        proc.wait()
+    assert not os.path.exists(path)
+
+
+def test_socket_in_private_directory(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmpdir.join('run').ensure(dir=True)))
+    assert os.path.dirname(daemon.socket_path('.')) == str(tmpdir.join('run'))
+
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    monkeypatch.setattr('tempfile.tempdir', str(tmpdir))
+    directory = os.path.dirname(daemon.socket_path('.'))
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+    os.chmod(directory, 0o755)
+    with pytest.raises(Exception) as e:
+        daemon.socket_path('.')
+    assert 'only accessible by its owner' in str(e.value)
+
+
+def test_client_refuses_socket_of_other_user(tmpdir, monkeypatch):
+    path = str(tmpdir.join('daemon.sock'))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    server.settimeout(.5)
+    uid = os.getuid()
+    monkeypatch.setattr(os, 'getuid', lambda: uid + 1)
+    try:
+        assert daemon.run_remote(['--version'], path) is None
+        with pytest.raises(socket.timeout):
+            server.accept()
+    finally:
+        server.close()
+
+
+def test_invocation_killed_when_client_disconnects(testdir):
+    testdir.makepyfile(test_chatty="""
+        import time
+
+        def test_chatty():
+            for _ in range(600):
+                print('x' * 1000)
+                time.sleep(.05)
+    """, disconnect="""
+        import os
+        import socket
+
+        from pytest_mp import daemon
+
+        forked = []
+        fork = os.fork
+        os.fork = lambda: forked.append(fork()) or forked[-1]
+
+        conn, client = socket.socketpair()
+        client.close()
+        request = dict(args=['-s', '-p', 'no:cacheprovider', 'test_chatty.py'], cwd=os.getcwd(), env=dict(os.environ))
+        try:
+            daemon.run_invocation(conn, request)
+        except socket.error:
+            print(forked[0])
+    """)
+
+    # In a subprocess, so that the fork writes to the daemon's pipe rather than to this test's capture.
+    start = time.time()
+    output = subprocess.check_output([sys.executable, 'disconnect.py'], cwd=str(testdir.tmpdir))
+    assert time.time() - start < 15
+    assert not psutil.pid_exists(int(output))  # Killed and reaped rather than left running.
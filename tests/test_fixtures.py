@@ -160,3 +160,121 @@ def test_mp_trail_finish_never_true_with_consumers(testdir):
     result = testdir.runpytest('--mp')
     result.assert_outcomes(passed=100)
     assert result.ret == 0
+
+
+def test_mp_trail_unrelated_trails_set_up_in_parallel(testdir):
+    testdir.makepyfile("""
+        import time
+
+        def wait_for(mp_message_board, key):
+            deadline = time.time() + 30
+            while key not in mp_message_board:
+                assert time.time() < deadline, 'trail setup was serialized'
+                time.sleep(.05)
+
+        def test_one(mp_trail, mp_message_board):
+            with mp_trail('parallel_one') as start:
+                assert start
+                mp_message_board['one_started'] = True
+                wait_for(mp_message_board, 'two_started')
+
+        def test_two(mp_trail, mp_message_board):
+            with mp_trail('parallel_two') as start:
+                assert start
+                mp_message_board['two_started'] = True
+                wait_for(mp_message_board, 'one_started')
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2')
+    result.assert_outcomes(passed=2)
+    assert result.ret == 0
+
+
+def test_mp_trail_publishes_setup_value(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.parametrize('val', range(10))
+        def test_mp_trail(val, mp_trail):
+            with mp_trail('published') as start:
+                if start:
+                    time.sleep(.5)
+                    start.value = dict(port=1234)
+                value = start.value
+
+            assert value == dict(port=1234)
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '4')
+    result.assert_outcomes(passed=10)
+    assert result.ret == 0
+
+
+def test_mp_trail_followers_run_concurrently(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.parametrize('val', range(3))
+        def test_mp_trail(val, mp_trail, mp_message_board):
+            with mp_trail('followed') as start:
+                if start:
+                    time.sleep(.5)
+                    return
+                mp_message_board['follower_{}'.format(val)] = True
+                deadline = time.time() + 30
+                while len([key for key in mp_message_board if key.startswith('follower_')]) < 2:
+                    assert time.time() < deadline, 'followers were serialized'
+                    time.sleep(.05)
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '3')
+    result.assert_outcomes(passed=3)
+    assert result.ret == 0
+
+
+def test_mp_trail_setup_skip_reaches_followers(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.parametrize('val', range(4))
+        def test_mp_trail(val, mp_trail):
+            with mp_trail('skipping') as start:
+                if start:
+                    time.sleep(.5)
+                    pytest.skip('no database here')
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '4', '-rs')
+    result.assert_outcomes(skipped=4)
+    result.stdout.fnmatch_lines(['*no database here*'])
+
+
+def test_mp_trail_setup_error_reaches_followers(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.parametrize('val', range(4))
+        def test_mp_trail(val, mp_trail):
+            with mp_trail('failing') as start:
+                if start:
+                    time.sleep(.5)
+                    raise ValueError('provisioning failed')
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '4')
+    result.assert_outcomes(failed=4)
+    result.stdout.fnmatch_lines(['*ValueError: provisioning failed*',
+                                 '*mp_trail failing setup failed in another process: ValueError: provisioning failed*'])
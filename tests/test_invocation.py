@@ -1,5 +1,14 @@
+import os
+import sys
+import tempfile
+
 import pytest
 import psutil
+import py
+
+from _pytest.assertion.rewrite import PYC_TAIL
+
+from pytest_mp.collection import collection_files, warm_files
 
 cpu_count = psutil.cpu_count()
 
@@ -89,3 +98,131 @@ def test_ini_with_cmdline(testdir, cmd_mp, cmd_num_processes, ini_content, ini_m
 
     result.stdout.re_match_lines(['.*2 passed.*in.*seconds.*'])
     assert result.ret == 0
+
+
+@pytest.mark.parametrize('args, use_mp, reporter', (((), False, 'TerminalReporter'),
+                                                    (('--instafail',), False, 'MPTerminalReporter'),
+                                                    (('--mp', '--collect-only'), False, None),
+                                                    (('--mp', '--np', '1'), True, 'MPTerminalReporter')))
+def test_manager_only_started_with_mp(testdir, args, use_mp, reporter):
+    testdir.makepyfile("""
+        import psutil
+
+        def test_one(request, mp_use_mp, mp_message_board, mp_trail):
+            with mp_trail('started') as start:
+                mp_message_board['one'] = 1
+            assert mp_message_board['one'] == 1
+
+            name = type(request.config.pluginmanager.get_plugin('terminalreporter')).__name__
+            # The Manager server is a child of the pytest process, and with --mp tests run in a child too.
+            pytest_process = psutil.Process().parent() if mp_use_mp else psutil.Process()
+            print('reporter: {}, children: {}'.format(name, len(pytest_process.children())))
+
+    """)
+
+    result = testdir.runpytest_subprocess('-s', *args)
+    if reporter is None:
+        assert result.ret == 0
+        assert 'reporter:' not in result.stdout.str()
+        return
+    result.stdout.fnmatch_lines(['*reporter: {}*'.format(reporter)])
+    if use_mp:
+        result.stdout.fnmatch_lines(['*children: [3-9]*'])  # Manager, process loop and test process
+    else:
+        result.stdout.fnmatch_lines(['*children: 0*'])
+
+
+@pytest.mark.parametrize('use_mp', (True, False))
+def test_session_directories_only_created_when_needed(testdir, monkeypatch, use_mp):
+    tmp = py.path.local(tempfile.mkdtemp())  # Short enough for the Manager's socket path.
+    monkeypatch.setenv('TMPDIR', str(tmp))
+    testdir.makepyfile("""
+        import os
+        import tempfile
+
+        import pytest
+
+        def session_directories():
+            return sorted(x.split('-')[2] for x in os.listdir(tempfile.gettempdir()) if x.startswith('pytest-mp-'))
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        def test_plain():
+            print('plain: {}'.format(session_directories()))
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        def test_locks(mp_locks):
+            with mp_locks.lock('one'):
+                pass
+            print('locks: {}'.format(session_directories()))
+
+    """)
+
+    try:
+        result = testdir.runpytest_subprocess('-s', '-p', 'no:cacheprovider', *(('--mp',) if use_mp else ()))
+        result.assert_outcomes(passed=2)
+        if use_mp:
+            expected = ["plain: ['buffers', 'locks']", "locks: ['buffers', 'locks']"]
+        else:
+            expected = ['plain: []', "locks: ['locks']"]
+        assert all(x in result.stdout.str() for x in expected)
+        assert not [x for x in tmp.listdir() if x.basename.startswith('pytest-mp-')]
+    finally:
+        tmp.remove()
+
+
+def test_mp_collect_warms_caches(testdir, monkeypatch):
+    monkeypatch.setattr(sys, 'dont_write_bytecode', False)
+    monkeypatch.setattr('multiprocessing.cpu_count', lambda: 2)
+    testdir.makepyfile(not_imported='VALUE = 1',
+                       test_warmed="""
+        def test_one():
+            assert [1] == [2]
+
+        def test_two():
+            pass
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-collect')
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines(['E *assert ?1? == ?2?', 'E *At index 0 diff: 1 != 2'])
+    cached = [x.basename for x in testdir.tmpdir.join('__pycache__').listdir()]
+    assert any(x.startswith('not_imported.') for x in cached)
+
+
+def test_warm_files_writes_import_caches(testdir, monkeypatch):
+    monkeypatch.setattr(sys, 'dont_write_bytecode', False)
+    testdir.makepyfile(not_imported='VALUE = 1',
+                       test_warmed="""
+        def test_one():
+            assert [1] == [2]
+    """,
+                       test_broken='def test_broken(:')
+    config = testdir.parseconfigure()
+    files = collection_files(config)
+    assert sorted(x.basename for x in testdir.tmpdir.listdir('*.py')) == sorted(os.path.basename(x) for x, _ in files)
+
+    warm_files(config, files)
+    cached = [x.basename for x in testdir.tmpdir.join('__pycache__').listdir()]
+    assert any(x.startswith('not_imported.') and not x.endswith(PYC_TAIL) for x in cached)
+    assert 'test_warmed' + PYC_TAIL in cached
+    assert not any(x.startswith('test_broken.') for x in cached)
+
+
+def test_collection_files_limited_to_args(testdir):
+    testdir.makeconftest('')
+    testdir.makepyfile(outside='VALUE = 1', test_outside='def test_outside(): pass')
+    unit = testdir.mkpydir('unit')
+    unit.join('conftest.py').write('')
+    unit.join('helper.py').write('VALUE = 1')
+    unit.join('test_x.py').write('def test_x(): pass')
+    unit.join('test_y.py').write('def test_y(): pass')
+
+    config = testdir.parseconfigure('unit/test_x.py::test_x')
+    files = dict((os.path.relpath(x, str(testdir.tmpdir)), rewrite) for x, rewrite in collection_files(config))
+    assert files == {'conftest.py': True, os.path.join('unit', 'conftest.py'): True,
+                     os.path.join('unit', 'test_x.py'): True}
+
+    config = testdir.parseconfigure('unit')
+    files = set(os.path.relpath(x, str(testdir.tmpdir)) for x, _ in collection_files(config))
+    assert files == set(['conftest.py'] + [os.path.join('unit', x) for x in
+                                           ('__init__.py', 'conftest.py', 'helper.py', 'test_x.py', 'test_y.py')])
@@ -0,0 +1,159 @@
+import sys
+import threading
+
+import pytest
+
+from pytest_mp.lanes import LaneFixtureState
+
+
+needs_asyncio = pytest.mark.skipif(sys.version_info < (3, 5), reason='async def requires Python 3.5+')
+
+
+@needs_asyncio
+def test_async_free_runs_coroutines_concurrently(testdir):
+    testdir.makepyfile("""
+        import asyncio
+
+        import pytest
+
+        @pytest.mark.mp_group('Async', 'async_free', concurrency=20)
+        @pytest.mark.parametrize('val', range(20))
+        async def test_sleep(val):
+            await asyncio.sleep(.5)
+
+        def test_sync():
+            pass
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2')
+    result.assert_outcomes(passed=21)
+    assert result.duration < 20 * .5 / 2
+
+
+@needs_asyncio
+def test_async_free_per_test_state(testdir):
+    testdir.makepyfile("""
+        import asyncio
+        import threading
+
+        import pytest
+
+        @pytest.fixture(scope='module')
+        def module_resource():
+            return object()
+
+        @pytest.fixture
+        def per_test(request):
+            yield request.node.name
+
+        @pytest.mark.mp_group('Async', 'async_free')
+        @pytest.mark.parametrize('val', range(10))
+        async def test_state(val, per_test, module_resource, mp_message_board):
+            print('output of {}'.format(val))
+            await asyncio.sleep(.05)
+            assert per_test == 'test_state[{}]'.format(val)
+            mp_message_board.setdefault(id(module_resource), val)
+            assert val != 3
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '1')
+    result.assert_outcomes(passed=9, failed=1)
+    result.stdout.fnmatch_lines(['*test_state?3?*', '*Captured stdout call*', 'output of 3'])
+    assert 'output of 4' not in result.stdout.str()
+
+
+def test_async_free_sync_tests_share_lanes(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.mp_group('Lanes', 'async_free', concurrency=10)
+        @pytest.mark.parametrize('val', range(10))
+        def test_blocking(val):
+            time.sleep(.5)
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '1')
+    result.assert_outcomes(passed=10)
+    assert result.duration < 10 * .5 / 2
+
+
+@pytest.mark.parametrize('board', ('manager', 'mmap'))
+def test_threaded_free(testdir, board):
+    testdir.makepyfile("""
+        import threading
+        import time
+
+        import pytest
+
+        @pytest.fixture
+        def thread_name():
+            return threading.current_thread().name
+
+        @pytest.mark.mp_group('Threaded', 'threaded_free', concurrency=8)
+        @pytest.mark.parametrize('val', range(16))
+        def test_blocking(val, thread_name, mp_message_board):
+            time.sleep(.5)
+            print('done {}'.format(val))
+            mp_message_board[val] = (thread_name, threading.current_thread().name)
+            assert val != 7
+
+        def test_lanes(mp_message_board):
+            lanes = [mp_message_board[val] for val in range(16) if val in mp_message_board]
+            assert all(fixture_thread == test_thread for fixture_thread, test_thread in lanes)
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-board', board, '-rA')
+    result.assert_outcomes(passed=16, failed=1)
+    result.stdout.fnmatch_lines(['*test_blocking?7?*', '*Captured stdout call*', 'done 7'])
+    assert result.duration < 16 * .5 / 2
+
+
+def test_lane_fixture_state_reads_as_initialized():
+    class FakeFixtureDef(object):
+        scope = 'function'
+
+    initialized, uninitialized = FakeFixtureDef(), FakeFixtureDef()
+    initialized.cached_result = None  # As FixtureDef.__init__ does on pytest 5+.
+    FakeFixtureDef.cached_result = LaneFixtureState('cached_result', None)
+
+    assert initialized.cached_result is None
+    assert not hasattr(uninitialized, 'cached_result')
+
+    initialized.cached_result = ('value', 0, None)
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(initialized.cached_result))
+    thread.start()
+    thread.join()
+    assert seen == [None]
+    assert initialized.cached_result == ('value', 0, None)
+
+
+@needs_asyncio
+@pytest.mark.parametrize('use_mp', (True, False))
+def test_coroutine_calls_registered_for_async_free_groups(testdir, use_mp):
+    testdir.makepyfile(test_plain="""
+        import sys
+
+        def test_plain(request):
+            assert request.config.pluginmanager.get_plugin('mpcoroutinecalls') is None
+            assert 'pytest_mp.lanes' not in sys.modules
+    """)
+    args = ['--mp'] if use_mp else []
+    result = testdir.runpytest_subprocess('test_plain.py', *args)
+    result.assert_outcomes(passed=1)
+
+    testdir.makepyfile(test_async="""
+        import asyncio
+
+        import pytest
+
+        @pytest.mark.mp_group('Async', 'async_free')
+        async def test_sleep():
+            await asyncio.sleep(.1)
+            raise ValueError('awaited')
+    """)
+    result = testdir.runpytest_subprocess('test_async.py', *args)
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines(['*ValueError: awaited'])
@@ -0,0 +1,131 @@
+import os
+import pickle
+import stat
+import threading
+import time
+
+import pytest
+
+from pytest_mp.locks import FileLocks
+
+
+def test_mp_locks_named_lock_excludes_workers(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.parametrize('val', range(6))
+        def test_lock(val, mp_locks, mp_message_board):
+            with mp_locks.lock('exclusive'):
+                assert not mp_message_board.get('holding')
+                mp_message_board['holding'] = True
+                time.sleep(.1)
+                mp_message_board['holding'] = False
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '3')
+    result.assert_outcomes(passed=6)
+
+
+def test_mp_locks_readers_share_writers_exclude(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.parametrize('val', range(3))
+        def test_readers(val, mp_locks, mp_message_board):
+            with mp_locks.rwlock('resource').read():
+                mp_message_board['reader_{}'.format(val)] = True
+                # Every reader holds the lock at the same time.
+                for other in range(3):
+                    mp_message_board.wait_for('reader_{}'.format(other), timeout=30)
+
+        def test_writer(mp_locks):
+            lock = mp_locks.rwlock('resource')
+            with lock.write():
+                pass
+            time.sleep(.5)
+            with mp_locks.rwlock('resource').read():
+                assert not lock.acquire(blocking=False)
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '4')
+    result.assert_outcomes(passed=4)
+
+
+def test_file_locks(tmpdir):
+    locks = FileLocks(str(tmpdir.join('locks')))
+
+    lock = locks.lock('one')
+    assert lock.acquire()
+    assert not locks.lock('one').acquire(timeout=.05)
+    assert locks.lock('two').acquire(blocking=False)
+    lock.release()
+    with pytest.raises(Exception):
+        lock.release()
+
+    semaphore = locks.semaphore('pool', 2)
+    first, second, third = [pickle.loads(pickle.dumps(semaphore)) for _ in range(3)]
+    assert first.acquire() and second.acquire()
+    start = time.time()
+    assert not third.acquire(timeout=.1)
+    assert time.time() - start >= .1
+    first.release()
+    assert third.acquire(blocking=False)
+
+    with pytest.raises(ValueError):
+        locks.semaphore('empty', 0)
+
+    locks.cleanup()
+    assert not tmpdir.join('locks').check()
+
+
+def test_file_locks_failed_acquire_keeps_holder(tmpdir):
+    locks = FileLocks(str(tmpdir.join('locks')))
+
+    for lock in (locks.lock('one'), locks.rwlock('two'), locks.semaphore('three')):
+        assert lock.acquire()
+        assert not lock.acquire(blocking=False)
+        assert not lock.acquire(timeout=.05)
+        with pytest.raises(Exception):
+            lock.acquire()
+        lock.release()
+        assert lock.acquire(blocking=False)  # Released for real, not left locked by a stray fd.
+        lock.release()
+
+
+def test_file_locks_held_per_thread(tmpdir):
+    lock = FileLocks(str(tmpdir.join('locks'))).lock('shared')
+    acquired = []
+
+    def other_thread():
+        acquired.append(lock.acquire(timeout=.05))
+        if acquired[-1]:
+            lock.release()
+
+    assert lock.acquire()
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+    lock.release()
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+    assert acquired == [False, True]
+    with pytest.raises(Exception):
+        lock.release()
+
+
+def test_file_locks_session_directory_is_private():
+    first, second = FileLocks.for_session(), FileLocks.for_session()
+    try:
+        assert first.directory != second.directory
+        assert stat.S_IMODE(os.stat(first.directory).st_mode) == 0o700
+        assert os.path.dirname(first.lock('name').path) == first.directory
+    finally:
+        first.cleanup()
+        second.cleanup()
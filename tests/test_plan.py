@@ -0,0 +1,84 @@
+def test_plan_does_not_run_tests(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        @pytest.mark.parametrize('val', range(3))
+        def test_one(val):
+            assert False
+
+        def test_two():
+            assert False
+
+    """)
+
+    result = testdir.runpytest('--mp-plan', '--mp-plan-np=1,2')
+    result.stdout.fnmatch_lines(['*= pytest-mp plan =*',
+                                 '4 tests, 4.00s of test time (4 estimated)',
+                                 '--np 1    makespan     4.00s, utilization 100.0%, critical path Serial (serial) 3.00s',
+                                 '--np 2    makespan     3.00s, utilization  66.7%, critical path Serial (serial) 3.00s',
+                                 'groups dominating the timeline with --np 2:',
+                                 '    Serial (serial) takes 100% of the makespan: runs in a single process',
+                                 '*no tests ran*'])
+    assert result.ret == 0
+
+
+def test_plan_uses_recorded_durations(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.mp_group('Isolated', 'isolated_serial')
+        def test_isolated():
+            time.sleep(.5)
+
+        @pytest.mark.parametrize('val', range(4))
+        def test_free(val):
+            pass
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np=2')
+    result.assert_outcomes(passed=5)
+
+    result = testdir.runpytest('--mp-plan', '--np=2')
+    result.stdout.fnmatch_lines(['5 tests, *s of test time (0 estimated)',
+                                 '--np 2    makespan     0.5*s, utilization *%, critical path Isolated (isolated_serial) 0.5*s',
+                                 'groups dominating the timeline with --np 2:',
+                                 '    Isolated (isolated_serial) takes *% of the makespan: its isolation barriers idle 0.5*s of slot time'])
+
+
+def test_plan_async_free_lanes(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.mp_group('Async', 'async_free', concurrency=10)
+        @pytest.mark.parametrize('val', range(20))
+        def test_one(val):
+            pass
+
+    """)
+
+    result = testdir.runpytest('--mp-plan', '--mp-plan-np=1,2')
+    result.stdout.fnmatch_lines(['20 tests, 20.00s of test time (20 estimated)',
+                                 '--np 1    makespan     2.00s, utilization 100.0%, critical path Async (async_free) 2.00s',
+                                 '--np 2    makespan     1.00s, utilization 100.0%, critical path Async (async_free) 1.00s'])
+    assert result.ret == 0
+
+
+def test_plan_sharded_serial(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.mp_group('Sharded', 'sharded_serial')
+        @pytest.mark.parametrize('val', range(6))
+        def test_one(val):
+            pass
+
+    """)
+
+    result = testdir.runpytest('--mp-plan', '--mp-plan-np=1,3')
+    result.stdout.fnmatch_lines(['--np 1    makespan     6.00s, *',
+                                 '--np 3    makespan     2.00s, utilization 100.0%, *'])
+    assert result.ret == 0
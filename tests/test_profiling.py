@@ -0,0 +1,83 @@
+import pytest
+
+
+@pytest.mark.parametrize('use_mp', (True, False))
+def test_fixture_profile_aggregates_across_workers(testdir, use_mp):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.fixture(scope='session')
+        def expensive_session():
+            time.sleep(.1)
+            yield
+            time.sleep(.05)
+
+        @pytest.fixture
+        def cheap():
+            return 1
+
+        @pytest.mark.parametrize('val', range(4))
+        def test_one(val, expensive_session, cheap):
+            assert cheap
+
+    """)
+
+    result = testdir.runpytest('--mp' if use_mp else '', '--mp-fixture-profile=0')
+    result.assert_outcomes(passed=4)
+    if use_mp:
+        result.stdout.fnmatch_lines(['*= pytest-mp most expensive fixtures =*',
+                                     'fixture expensive_session (session) * built 4 times, *s total (*s setup, *s teardown)',
+                                     'fixture cheap (function) * built 4 times, *',
+                                     'session fixture expensive_session is rebuilt per worker process; *save up to *s'])
+    else:
+        result.stdout.fnmatch_lines(['fixture expensive_session (session) * built 1 time, *',
+                                     'fixture cheap (function) * built 4 times, *'])
+        assert 'rebuilt per worker process' not in result.stdout.str()
+    assert 'fixture val ' not in result.stdout.str()
+
+
+def test_fixture_profile_serial_builds_once(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.fixture(scope='module')
+        def shared():
+            return 1
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        @pytest.mark.parametrize('val', range(4))
+        def test_one(val, shared):
+            assert shared
+
+    """)
+
+    result = testdir.runpytest('--mp', '--mp-fixture-profile=1')
+    result.assert_outcomes(passed=4)
+    result.stdout.fnmatch_lines(['*= pytest-mp 1 most expensive fixtures =*',
+                                 'fixture shared (module) * built 1 time, *'])
+
+
+@pytest.mark.parametrize('strategy', ('serial', 'threaded_free'))
+def test_fixture_profile_counts_recycled_workers(testdir, strategy):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.fixture(scope='module')
+        def shared():
+            yield 1
+            time.sleep(.2)
+
+        @pytest.mark.mp_group('Recycled', '{}')
+        @pytest.mark.parametrize('val', range(4))
+        def test_one(val, shared):
+            assert shared
+
+    """.format(strategy))
+
+    result = testdir.runpytest('--mp', '--mp-max-tests-per-worker=2', '--mp-fixture-profile=1')
+    result.assert_outcomes(passed=4)
+    result.stdout.fnmatch_lines(['fixture shared (module) * built 2 times, * (*s setup, 0.[4-9]*s teardown)'])
@@ -0,0 +1,101 @@
+import pytest
+
+
+def test_report_not_shown_by_default(testdir):
+    testdir.makepyfile("""
+        def test_one():
+            assert True
+
+    """)
+
+    result = testdir.runpytest('--mp')
+    result.assert_outcomes(passed=1)
+    assert 'pytest-mp scheduler report' not in result.stdout.str()
+
+
+@pytest.mark.parametrize('strategy', ('free', 'serial', 'isolated_free', 'isolated_serial'))
+def test_report_sections(testdir, strategy):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        @pytest.mark.mp_group('Grouped', '{}')
+        @pytest.mark.parametrize('val', range(3))
+        def test_one(val):
+            time.sleep(.2)
+
+        def test_two():
+            assert True
+
+    """.format(strategy))
+
+    result = testdir.runpytest('--mp', '--np=2', '--mp-report')
+    result.assert_outcomes(passed=4)
+    result.stdout.fnmatch_lines(['*= pytest-mp scheduler report =*',
+                                 'worker slots: 2 x *s = *s, busy *s (*%) over * workers',
+                                 'spawn to first test: *s average',
+                                 'reaping latency: *s average',
+                                 'longest group (critical path): Grouped ({}) *s'.format(strategy),
+                                 'ideal makespan with --np 2: *s (actual *s)'])
+    if strategy.startswith('isolated'):
+        result.stdout.fnmatch_lines(['isolation barrier before Grouped: *s idle slot time',
+                                     'isolation barrier after Grouped: *s idle slot time'])
+    else:
+        assert 'isolation barrier' not in result.stdout.str()
+
+
+@pytest.mark.parametrize('strategy', ('serial', 'isolated_serial', 'sharded_serial', 'threaded_free'))
+def test_workers_recycled(testdir, strategy):
+    testdir.makepyfile("""
+        import os
+
+        import pytest
+
+        @pytest.fixture(scope='module')
+        def module_pid():
+            yield os.getpid()
+            with open('teardowns', 'a') as f:
+                f.write('{{}}\\n'.format(os.getpid()))
+
+        @pytest.mark.mp_group('Grouped', '{}', shards=1, concurrency=7)
+        @pytest.mark.parametrize('val', range(7))
+        def test_one(val, module_pid):
+            assert module_pid == os.getpid()
+            with open('pids', 'a') as f:
+                f.write('{{}} {{}}\\n'.format(val, os.getpid()))
+
+    """.format(strategy))
+
+    result = testdir.runpytest('--mp', '--np=2', '--mp-report', '--mp-max-tests-per-worker=3')
+    result.assert_outcomes(passed=7)
+    result.stdout.fnmatch_lines(['recycled workers: 2 (tests: 2)'])
+    pids = dict(line.split() for line in testdir.tmpdir.join('pids').readlines())
+    pids = [pids[str(val)] for val in range(7)]
+    assert pids == [pids[0]] * 3 + [pids[3]] * 3 + [pids[6]]
+    assert sorted(testdir.tmpdir.join('teardowns').read().split()) == sorted(set(pids))
+
+
+@pytest.mark.parametrize('strategy', ('serial', 'isolated_serial'))
+def test_crashed_worker_tail_resubmitted(testdir, strategy):
+    testdir.makepyfile("""
+        import os
+        import signal
+
+        import pytest
+
+        @pytest.mark.mp_group('Grouped', '{}')
+        @pytest.mark.parametrize('val', range(5))
+        def test_one(val):
+            if val == 1:
+                os.kill(os.getpid(), signal.SIGKILL)
+
+    """.format(strategy))
+
+    result = testdir.runpytest('--mp', '--np=2', '--mp-report', '--junitxml=junit.xml')
+    result.assert_outcomes(passed=4, failed=1)
+    result.stdout.fnmatch_lines(['*Worker * running this test exited unexpectedly with signal SIGKILL.',
+                                 'crashed workers: 1 (signal SIGKILL: 1)'])
+    assert result.ret == 1
+    xml = testdir.tmpdir.join('junit.xml').read()
+    assert 'failures="1"' in xml and 'tests="5"' in xml
@@ -0,0 +1,40 @@
+import pytest
+
+
+@pytest.mark.parametrize('use_mp', [False, True])
+def test_failed_tests_rerun(testdir, use_mp):
+    testdir.makepyfile("""
+        import os
+
+        import pytest
+
+        def attempt(name):
+            path = '{}.attempts'.format(name)
+            attempts = int(open(path).read()) + 1 if os.path.exists(path) else 1
+            with open(path, 'w') as f:
+                f.write(str(attempts))
+            return attempts
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        def test_flaky():
+            assert attempt('flaky') > 2
+
+        def test_broken():
+            attempt('broken')
+            assert False
+
+        @pytest.mark.mp_group('NoReruns', 'free', reruns=0)
+        def test_not_rerun():
+            assert attempt('not_rerun') > 1
+    """)
+
+    args = ('--mp',) if use_mp else ()
+    result = testdir.runpytest('--mp-reruns=2', '--junitxml=junit.xml', *args)
+    result.stdout.fnmatch_lines(['*2 failed, 1 passed, 4 rerun*'])
+    assert testdir.tmpdir.join('flaky.attempts').read() == '3'
+    assert testdir.tmpdir.join('broken.attempts').read() == '3'
+    assert testdir.tmpdir.join('not_rerun.attempts').read() == '1'
+    if use_mp:
+        xml = testdir.tmpdir.join('junit.xml').read()
+        assert xml.count('<rerunFailure message="rerun 1 (call)"') == 2
+        assert 'failures="2"' in xml
@@ -0,0 +1,68 @@
+import pytest
+
+from pytest_mp.resources import usage_since
+
+
+@pytest.mark.parametrize('strategy', ('free', 'serial'))
+def test_most_expensive_tests_summary(testdir, strategy):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.mp_group('Group', '{}')
+        def test_cpu_hog():
+            sum(x * x for x in range(2000000))
+
+        @pytest.mark.mp_group('Group')
+        def test_memory_hog():
+            hog = bytearray(64 * 1024 * 1024)
+            assert hog
+
+        @pytest.mark.mp_group('Group')
+        def test_cheap():
+            assert True
+
+    """.format(strategy))
+
+    result = testdir.runpytest('--mp', '--mp-resources=1')
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(['*= pytest-mp 1 most expensive tests =*',
+                                 'by CPU time (user/system):',
+                                 '*s *s  *::test_cpu_hog',
+                                 'by peak RSS growth (read/write bytes):',
+                                 '*MiB*  *::test_memory_hog'])
+
+
+def test_not_recorded_by_default(testdir):
+    testdir.makepyfile("""
+        def test_one():
+            assert True
+
+    """)
+
+    result = testdir.runpytest('--mp')
+    result.assert_outcomes(passed=1)
+    assert 'most expensive tests' not in result.stdout.str()
+
+
+def test_junit_properties(testdir):
+    testdir.makepyfile("""
+        def test_one():
+            assert True
+
+    """)
+
+    result = testdir.runpytest('--mp', '--mp-resources=0', '--junitxml=junit.xml')
+    result.assert_outcomes(passed=1)
+    xml = testdir.tmpdir.join('junit.xml').read()
+    for name in ('mp_cpu_user', 'mp_cpu_system', 'mp_peak_rss_growth'):
+        assert '<property name="{}" value='.format(name) in xml
+
+
+def test_peak_rss_charged_only_when_raised():
+    start = dict(cpu_user=1.0, cpu_system=.5, peak_rss=100 * 1024 * 1024)
+    unchanged = usage_since(start, dict(start, cpu_user=1.25))
+    assert unchanged == dict(cpu_user=.25, cpu_system=0, peak_rss_growth=0)
+
+    raised = usage_since(start, dict(start, peak_rss=164 * 1024 * 1024))
+    assert raised['peak_rss_growth'] == 64 * 1024 * 1024
+    assert raised['peak_rss'] == 164 * 1024 * 1024
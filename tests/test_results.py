@@ -0,0 +1,68 @@
+def outcomes(result):
+    return dict((k, v) for k, v in result.parseoutcomes().items() if k != 'seconds')
+
+
+def test_cache_skips_passed_tests(testdir):
+    testdir.makepyfile(helper="""
+        value = 1
+    """, test_cached="""
+        import helper
+
+        def test_pass():
+            assert helper.value == 1
+
+        def test_fail():
+            assert False
+    """, test_other="""
+        def test_other():
+            pass
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-cache')
+    assert outcomes(result) == dict(passed=2, failed=1)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-cache', '-v')
+    assert outcomes(result) == dict(cached=2, failed=1)
+    result.stdout.fnmatch_lines(['*test_cached.py::test_pass CACHED*'])
+
+    # Changing an imported module only runs the tests depending on it again.
+    testdir.makepyfile(helper="""
+        value = 1  # changed
+    """)
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-cache')
+    assert outcomes(result) == dict(passed=1, cached=1, failed=1)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-cache', '--mp-cache-clear')
+    assert outcomes(result) == dict(passed=2, failed=1)
+
+
+def test_cache_keeps_serial_groups_whole(testdir):
+    testdir.makepyfile(test_serial="""
+        import os
+
+        import pytest
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        def test_one():
+            pass
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        def test_two():
+            assert not os.path.exists('fail')
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-cache')
+    assert outcomes(result) == dict(passed=2)
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-cache', '--junitxml=junit.xml')
+    assert outcomes(result) == dict(cached=2)
+    junit = testdir.tmpdir.join('junit.xml').read()
+    assert 'tests="2"' in junit and 'failures="0"' in junit and 'skips="0"' in junit
+    assert junit.count('<testcase ') == 2
+    assert junit.count('<property name="mp_cached" value="True"') == 2
+
+    testdir.tmpdir.join('fail').write('')
+    testdir.runpytest('--mp', '--np', '2', '--mp-cache', '--mp-cache-clear')
+    testdir.tmpdir.join('fail').remove()
+    # test_one passed, but its group isn't fully cached, so it runs again.
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-cache')
+    assert outcomes(result) == dict(passed=2)
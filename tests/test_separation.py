@@ -180,3 +180,95 @@ def test_isolated_trail_separation(testdir):
     result = testdir.runpytest('--mp')
     result.assert_outcomes(passed=1000)
     assert result.ret == 0
+
+
+def test_next_isolated_group_prewarms_during_drain(testdir):
+    testdir.makepyfile("""
+        import time
+
+        import pytest
+
+        def stamp(name):
+            with open(name, 'w') as f:
+                f.write(repr(time.time()))
+
+        @pytest.fixture(scope='session')
+        def warm():
+            stamp('warmed')
+
+        @pytest.mark.mp_group('First', 'isolated_serial')
+        def test_first():
+            time.sleep(1)
+            stamp('first_done')
+
+        @pytest.mark.mp_group('Second', 'isolated_serial', prewarm=['warm'])
+        def test_second(warm):
+            stamp('second_started')
+
+        @pytest.mark.mp_group('Second')
+        def test_second_again(warm):
+            pass
+    """)
+
+    def stamp(name):
+        return float(testdir.tmpdir.join(name).read())
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-report')
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(['prewarmed workers: 1 *'])
+    # The fixture marked safe to prewarm was set up while the first group ran, the test only after it.
+    assert stamp('warmed') < stamp('first_done') < stamp('second_started')
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-no-prewarm')
+    result.assert_outcomes(passed=3)
+    assert stamp('first_done') < stamp('warmed') < stamp('second_started')
+
+
+def test_prewarm_names_requested_fixtures(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.fixture(scope='session')
+        def warm():
+            pass
+
+        @pytest.mark.mp_group('Second', 'isolated_serial', prewarm=['wram'])
+        def test_second(warm):
+            pass
+    """)
+
+    result = testdir.runpytest('--mp')
+    result.stdout.fnmatch_lines(["*Exception: Second prewarms wram, which test_second doesn't request."])
+    assert result.ret == 3
+
+
+def test_prewarmed_workers_count_against_np(testdir):
+    testdir.makepyfile("""
+        import os
+        import time
+
+        import psutil
+        import pytest
+
+        def processes():
+            return [x for x in psutil.Process(os.getppid()).children() if x.status() != psutil.STATUS_ZOMBIE]
+
+        @pytest.mark.mp_group('First', 'isolated_free')
+        @pytest.mark.parametrize('val', range(4))
+        def test_first(val, mp_message_board):
+            time.sleep(.5 + val * .3)
+            mp_message_board[val] = len(processes())
+
+        @pytest.mark.mp_group('Second', 'isolated_free')
+        @pytest.mark.parametrize('val', range(2))
+        def test_second(val):
+            pass
+
+        def test_counts(mp_message_board):
+            # Always two workers, of the first group or prewarmed ones of the second, besides the manager.
+            assert len(set(mp_message_board[x] for x in range(4))) == 1
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-report')
+    result.assert_outcomes(passed=7)
+    result.stdout.fnmatch_lines(['prewarmed workers: [12] *'])
@@ -0,0 +1,181 @@
+import pytest
+
+from pytest_mp.shared import SharedFixtures
+
+
+@pytest.mark.parametrize('use_mp', (True, False))
+def test_mp_shared_fixture_set_up_once(testdir, use_mp):
+    testdir.makeconftest("""
+        import os
+
+        from pytest_mp import mp_shared_fixture
+
+        @mp_shared_fixture
+        def shared_setup_pid():
+            with open('setups.txt', 'a') as f:
+                f.write('setup\\n')
+            yield os.getpid()
+            with open('setups.txt', 'a') as f:
+                f.write('teardown\\n')
+
+    """)
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('val', range(4))
+        def test_one(val, shared_setup_pid):
+            assert shared_setup_pid
+
+        @pytest.mark.mp_group('Other', 'serial')
+        def test_two(shared_setup_pid):
+            assert shared_setup_pid
+
+    """)
+
+    result = testdir.runpytest('--mp' if use_mp else '')
+    result.assert_outcomes(passed=5)
+    assert testdir.tmpdir.join('setups.txt').read() == 'setup\nteardown\n'
+
+
+def test_mp_shared_fixture_torn_down_after_last_consumer_group(testdir):
+    testdir.makepyfile("""
+        import os
+
+        import pytest
+
+        from pytest_mp import mp_shared_fixture
+
+        @mp_shared_fixture
+        def base():
+            return 'base'
+
+        @mp_shared_fixture
+        def resource(base):
+            yield base + ':' + str(os.getpid())
+            with open('teardown.txt', 'w') as f:
+                f.write('done')
+
+        @pytest.mark.mp_group('Consumers', 'isolated_free')
+        @pytest.mark.parametrize('val', range(3))
+        def test_consumer(val, resource):
+            assert resource.startswith('base:')
+            assert resource != 'base:' + str(os.getpid())  # set up by the coordinator
+            assert not os.path.exists('teardown.txt')
+
+        @pytest.mark.mp_group('Later', 'serial')
+        def test_later():
+            assert os.path.exists('teardown.txt')
+
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2')
+    result.assert_outcomes(passed=4)
+
+
+def test_mp_shared_fixture_errors(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        from pytest_mp import mp_shared_fixture
+
+        @pytest.fixture(scope='session')
+        def plain():
+            return 1
+
+        @mp_shared_fixture
+        def needs_plain(plain):
+            return plain
+
+        @mp_shared_fixture(name='broken')
+        def broken_fixture():
+            raise ValueError('cannot provision')
+
+        def test_needs_plain(needs_plain):
+            pass
+
+        @pytest.mark.parametrize('val', range(2))
+        def test_broken(val, broken):
+            pass
+
+    """)
+
+    result = testdir.runpytest('--mp')
+    result.assert_outcomes(error=3)
+    result.stdout.fnmatch_lines(['*mp_shared_fixture needs_plain setup failed in the coordinator: '
+                                 'Exception: mp_shared_fixture needs_plain depends on plain, which is not an '
+                                 'mp_shared_fixture.*'])
+    result.stdout.fnmatch_lines(['*mp_shared_fixture broken setup failed in the coordinator: '
+                                 'ValueError: cannot provision*'])
+
+
+def test_mp_shared_fixture_skip_and_fail(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        from pytest_mp import mp_shared_fixture
+
+        @mp_shared_fixture
+        def unavailable():
+            pytest.skip('no database here')
+
+        @mp_shared_fixture
+        def failing():
+            pytest.fail('cannot provision')
+
+        @pytest.mark.parametrize('val', range(2))
+        def test_unavailable(val, unavailable):
+            pass
+
+        def test_failing(failing):
+            pass
+
+        def test_other():
+            pass
+
+    """)
+
+    result = testdir.runpytest('--mp', '-rs')
+    result.assert_outcomes(passed=1, skipped=2, error=1)
+    result.stdout.fnmatch_lines(['*no database here*'])
+    result.stdout.fnmatch_lines(['*mp_shared_fixture failing setup failed in the coordinator: Failed: cannot provision*'])
+    assert 'INTERNALERROR' not in result.stdout.str()
+
+
+def test_mp_shared_fixture_teardown_error_reported(testdir):
+    testdir.makepyfile("""
+        from pytest_mp import mp_shared_fixture
+
+        @mp_shared_fixture
+        def leaky():
+            yield 1
+            raise ValueError('cannot release')
+
+        def test_leaky(leaky):
+            assert leaky == 1
+
+    """)
+
+    result = testdir.runpytest('--mp')
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(['*mp_shared_fixture teardown errors*', 'leaky (ValueError: cannot release)'])
+    assert 'INTERNALERROR' not in result.stdout.str()
+    assert result.ret == 1
+
+
+def test_shared_fixtures_count_workers_reaped_before_dispatch():
+    torn_down = []
+
+    def resource():
+        yield 1
+        torn_down.append(True)
+
+    shared = SharedFixtures(None, {})
+    shared.needed['Group'] = {resource: 'test_module.py::test_one'}
+    shared.consumers[resource] = set(['Group'])
+
+    shared.reaped('Group')  # e.g. a prewarmed worker of the group that died before its release
+    shared.dispatch('Group', 2)
+    assert not torn_down
+    shared.reaped('Group')
+    assert torn_down
+    assert shared.close() == []
@@ -236,3 +236,31 @@ def test_isolated_with_another_strategy(c, strategy1, strategy2, testdir, tmpdir
 
     result = testdir.runpytest('--mp', '--np=2')
     result.assert_outcomes(passed=2)
+
+
+def test_sharded_serial(testdir):
+    """Confirms that a sharded_serial group is split into contiguous shards with their own session fixtures
+    """
+    testdir.makepyfile("""
+        import os
+
+        import pytest
+
+        @pytest.fixture(scope='session')
+        def session_pid():
+            return os.getpid()
+
+        @pytest.mark.mp_group('Sharded', 'sharded_serial', shards=3)
+        @pytest.mark.parametrize('val', range(9))
+        def test_one(val, session_pid):
+            assert session_pid == os.getpid()
+            with open('pids', 'a') as f:
+                f.write('{} {}\\n'.format(val, os.getpid()))
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2')
+    result.assert_outcomes(passed=9)
+    pids = dict(line.split() for line in testdir.tmpdir.join('pids').readlines())
+    pids = [pids[str(val)] for val in range(9)]
+    assert pids == [pids[0]] * 3 + [pids[3]] * 3 + [pids[6]] * 3
+    assert len(set(pids)) == 3
@@ -0,0 +1,75 @@
+def test_stream_runs_free_tests_during_collection(testdir):
+    testdir.makepyfile(test_a_first="""
+        import time
+
+        def test_early():
+            with open('early', 'w') as f:
+                f.write(str(time.time()))
+    """, test_b_slow="""
+        import time
+
+        time.sleep(1)  # Slow collection.
+        collected = time.time()
+
+        def test_free():
+            pass
+    """, test_c_grouped="""
+        import time
+
+        import pytest
+
+        collected = time.time()
+
+        @pytest.mark.mp_group('Serial', 'serial')
+        def test_serial():
+            with open('serial', 'w') as f:
+                f.write(str(collected))
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-stream')
+    result.assert_outcomes(passed=3)
+    # test_early ran before collection of the following modules finished, serial groups only after.
+    assert float(testdir.tmpdir.join('early').read()) < float(testdir.tmpdir.join('serial').read())
+
+
+def test_stream_ignored_with_deselection(testdir):
+    testdir.makepyfile("""
+        def test_one():
+            pass
+
+        def test_two():
+            assert False
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-stream', '-k', 'one')
+    result.assert_outcomes(passed=1)
+
+
+def test_stream_ignored_with_conftest_modifying_items(testdir):
+    testdir.makeconftest("""
+        import pytest
+
+        def pytest_addoption(parser):
+            parser.addoption('--runslow', action='store_true', default=False)
+
+        def pytest_collection_modifyitems(config, items):
+            if config.getoption('--runslow'):
+                return
+            skip_slow = pytest.mark.skip(reason='need --runslow option to run')
+            for item in items:
+                if 'slow' in item.keywords:
+                    item.add_marker(skip_slow)
+    """)
+    testdir.makepyfile(test_a_slow="""
+        import pytest
+
+        @pytest.mark.slow
+        def test_slow():
+            assert False
+    """, test_b_fast="""
+        def test_fast():
+            pass
+    """)
+
+    result = testdir.runpytest('--mp', '--np', '2', '--mp-stream')
+    result.assert_outcomes(passed=1, skipped=1)